@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""
+MeetUp 013 - Beginners Python Support Sessions - Reading large Excel files into sqlite database
+
+Companion to meetup013_excel_to_sqlite.py
+
+@author D Tim Cummings
+
+meetup013_excel_to_sqlite.py reads every worksheet of bank_accounts.xlsx into memory with pd.read_excel, calculates
+running balances with df_combined.iterrows() and df.at, and inserts one row at a time. That is fine for a few hundred
+transactions but a workbook with millions of transactions takes minutes and gigabytes of memory.
+
+This version produces the same tbl_transaction while only holding batch_rows transactions in memory:
+- openpyxl in read_only mode reads worksheet rows one at a time from the xlsx file rather than loading every cell
+- Each worksheet (account) is already in date order, so heapq.merge combines them in date order without sorting
+  everything: it only looks at the next row of each worksheet (the merge step of a merge sort). Accounts with the
+  same date keep worksheet order
+- Balances are calculated a batch at a time with numpy cumsum of amounts in cents (whole numbers so there is no
+  rounding error however many transactions are added), carrying the balance from one batch to the next
+- Each batch is inserted with executemany in one transaction into tbl_transaction_new. Only after the last batch
+  is tbl_transaction replaced by it (drop and rename in one transaction), so an error part way through leaves the
+  old tbl_transaction as it was
+Worksheets which aren't in date order raise ValueError. Use presorted=False to sort them in memory instead.
+
+Usage:
+    python meetup013_Tim_excel_to_sqlite_streaming.py bank_accounts.xlsx --db db_transactions.sqlite
+
+Make a large workbook to try it:
+    python meetup013_Tim_excel_to_sqlite_streaming.py big.xlsx --sample 2000000
+
+requirements.txt
+openpyxl
+numpy
+"""
+
+# Standard libraries
+import argparse
+import datetime
+import heapq
+import logging
+import operator
+import random
+import sqlite3
+import time
+# Third party libraries
+import numpy as np
+import openpyxl
+
+logger = logging.getLogger(__name__)
+
+# Transactions held in memory and inserted in each transaction
+BATCH_ROWS = 50_000
+COLUMNS = ('Date', 'Description', 'Amount', 'Balance')
+TABLE = "tbl_transaction"
+# Transactions are loaded into this table then renamed to TABLE when complete
+TABLE_NEW = "tbl_transaction_new"
+
+SQL_CREATE = """create table {table} (
+    id integer primary key,
+    date_transaction date,
+    num_amount numeric,
+    num_balance numeric,
+    vc_account varchar,
+    vc_description varchar
+)"""
+SQL_INSERT = """insert into {table} (id, date_transaction, num_amount, num_balance, vc_account, vc_description)
+values (?, ?, ?, ?, ?, ?)"""
+SQL_REPLACE = f"""begin;
+drop table if exists {TABLE};
+alter table {TABLE_NEW} rename to {TABLE};
+commit;"""
+
+
+def as_date(value):
+    """Excel dates are read as datetime.datetime. tbl_transaction stores datetime.date"""
+    return value.date() if isinstance(value, datetime.datetime) else value
+
+
+def iter_transactions(ws, presorted=True):
+    """Yield (date, cents, description, balance) for each row of worksheet with negated amounts for liabilities
+
+    Row 1 has column names, which must include Date, Description, Amount and Balance in any order
+    """
+    rows = ws.iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None:
+        return
+    dct_col = {name: i for i, name in enumerate(header)}
+    missing = [name for name in COLUMNS if name not in dct_col]
+    if missing:
+        raise ValueError(f"iter_transactions: worksheet {ws.title} has no column {missing}")
+    i_date, i_description, i_amount, i_balance = [dct_col[name] for name in COLUMNS]
+    sign = -1 if 'liability' in ws.title else 1
+
+    def transactions():
+        for num_row, row in enumerate(rows, start=2):
+            if row[i_date] is None:
+                continue
+            if row[i_amount] is None:
+                raise ValueError(f"iter_transactions: worksheet {ws.title} row {num_row} has no Amount")
+            yield (as_date(row[i_date]), round(sign * row[i_amount] * 100), row[i_description],
+                   None if row[i_balance] is None else sign * row[i_balance])
+
+    if not presorted:
+        yield from sorted(transactions(), key=operator.itemgetter(0))
+        return
+    date_previous = None
+    for transaction in transactions():
+        if date_previous is not None and transaction[0] < date_previous:
+            raise ValueError(f"iter_transactions: worksheet {ws.title} not in date order at {transaction[0]}. "
+                             f"Use presorted=False")
+        date_previous = transaction[0]
+        yield transaction
+
+
+def opening_cents(wb):
+    """Balance before first transaction of each account, added up, in cents. Only reads first row of each sheet"""
+    cents = 0
+    for ws in wb.worksheets:
+        for date_transaction, amount_cents, description, balance in iter_transactions(ws):
+            cents += round(balance * 100) - amount_cents
+            break
+    return cents
+
+
+def iter_merged(wb, presorted=True):
+    """Yield (date, cents, description, account) for every worksheet in date order"""
+
+    def tagged(ws):
+        for date_transaction, amount_cents, description, balance in iter_transactions(ws, presorted):
+            yield date_transaction, amount_cents, description, ws.title
+
+    return heapq.merge(*[tagged(ws) for ws in wb.worksheets], key=operator.itemgetter(0))
+
+
+def iter_batches(iterable, batch_rows):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= batch_rows:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def import_workbook(filename, db, batch_rows=BATCH_ROWS, presorted=True):
+    """Replace tbl_transaction in db with transactions from every worksheet of filename with running balances
+
+    tbl_transaction is only replaced if every transaction is read, otherwise it is left as it was.
+    :return: number of transactions inserted
+    """
+    wb = openpyxl.load_workbook(filename, read_only=True, data_only=True)
+    sql_insert = SQL_INSERT.format(table=TABLE_NEW)
+    try:
+        balance_cents = opening_cents(wb)
+        with db:
+            db.execute(f"drop table if exists {TABLE_NEW}")
+            db.execute(SQL_CREATE.format(table=TABLE_NEW))
+        pk = 0
+        for batch in iter_batches(iter_merged(wb, presorted), batch_rows):
+            lst_date, lst_cents, lst_description, lst_account = zip(*batch)
+            ar_balance_cents = balance_cents + np.cumsum(np.array(lst_cents, dtype=np.int64))
+            balance_cents = int(ar_balance_cents[-1])
+            # isoformat because sqlite3's default date adapter is deprecated. PARSE_DECLTYPES still returns dates
+            params = zip(range(pk, pk + len(batch)), [d.isoformat() for d in lst_date],
+                         (np.array(lst_cents) / 100).tolist(), (ar_balance_cents / 100).tolist(), lst_account,
+                         lst_description)
+            with db:
+                db.executemany(sql_insert, params)
+            pk += len(batch)
+            logger.debug(f"import_workbook: {pk} transactions to {lst_date[-1]}")
+        db.executescript(SQL_REPLACE)
+        return pk
+    except Exception:
+        db.rollback()
+        with db:
+            db.execute(f"drop table if exists {TABLE_NEW}")
+        raise
+    finally:
+        wb.close()
+
+
+def write_sample_workbook(filename, num_rows, lst_account=('cheque', 'savings', 'credit card liability'), seed=0):
+    """Make workbook of num_rows random transactions spread over worksheets of lst_account, each in date order"""
+    rng = random.Random(seed)
+    wb = openpyxl.Workbook(write_only=True)
+    date_start = datetime.date(2000, 1, 1)
+    for i, account in enumerate(lst_account):
+        ws = wb.create_sheet(account)
+        ws.append(list(COLUMNS))
+        num = num_rows // len(lst_account) + (i < num_rows % len(lst_account))
+        balance = 1000.0
+        for j in range(num):
+            amount = round(rng.uniform(-200, 200), 2)
+            balance = round(balance + amount, 2)
+            ws.append([datetime.datetime.combine(date_start + datetime.timedelta(days=j * 10_000 // max(num, 1)),
+                                                 datetime.time()),
+                       f"{account} {j}", amount, balance])
+    wb.save(filename)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MeetUp013 - import bank account workbook into sqlite")
+    parser.add_argument("filename", nargs="?", default="bank_accounts.xlsx", help="xlsx with one sheet per account")
+    parser.add_argument("--db", default="db_transactions.sqlite", help="sqlite database file")
+    parser.add_argument("--sample", type=int, default=0, help="first write a sample workbook with this many rows")
+    parser.add_argument("--unsorted", action="store_true", help="sort worksheets not in date order in memory")
+    parser.add_argument("-l", "--log", default="INFO", action="store", help="set log level. eg: --log INFO",
+                        type=str.upper, choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"])
+    args = parser.parse_args()
+    logging.basicConfig(level=getattr(logging, args.log))
+    if args.sample:
+        time_start = time.perf_counter()
+        write_sample_workbook(args.filename, args.sample)
+        print(f"Wrote {args.sample} transactions to {args.filename} in {time.perf_counter() - time_start:.1f}s")
+    sqlite_db = sqlite3.connect(database=args.db, detect_types=sqlite3.PARSE_DECLTYPES)
+    time_start = time.perf_counter()
+    num_transactions = import_workbook(args.filename, sqlite_db, presorted=not args.unsorted)
+    print(f"Imported {num_transactions} transactions in {time.perf_counter() - time_start:.1f}s")
+    sqlite_db.row_factory = sqlite3.Row
+    for record in sqlite_db.execute("select * from tbl_transaction order by id desc limit 3"):
+        print(dict(record))
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""MeetUp 057 - Beginners' Python and Machine Learning - dash plotly data cache
+
+Companion to meetup057_tim_dash_plotly.py
+
+Task 3 of meetup057 uses data_cache.DataCache from https://github.com/timcu/bpaml-dash-graph which holds the
+code from meetup053. Every dash callback (changing country, state, slider) calls meetup053's series_sum_for_location
+which filters the whole JHU DataFrame with a boolean mask, sums it and converts the dates with pd.to_datetime.
+
+Instead, each case type is aggregated once into a LocationMatrix: a (location x date) int32 numpy matrix with a
+row for each (country, state), each country total, each state name and everywhere, plus dicts from
+(country, state) to row. Dates are parsed once into a DatetimeIndex. A location's series is then a row of the
+matrix found with a dict lookup.
+
+Doubling days (averaged_days / log2(current / previous) in meetup053 plot_for_location) are calculated for every
+location and each of AVERAGED_DAYS in one pass over the matrix. log2 of the matrix is taken once, so
+log2(current / previous) is a subtraction of two shifted slices of it. Unlike meetup053:
+- previous of 0 (including the first averaged_days dates) or current of 0 gives NaN rather than 0 or NaN
+- no growth or a fall (current <= previous, eg after a correction) gives inf (never doubles) rather than inf or a
+  negative number of days
+Countries are sorted by their latest doubling days when the matrix is built so ranking them is a lookup.
+
+This DataCache also keeps the series it has calculated in a least recently used (LRU) cache keyed by
+(case_type, country, state), so the pandas work for a location is only done once however many users select it.
+- The cache holds at most max_series series. When full, the one used least recently is dropped
+- refresh() reads a case type again, rebuilds its LocationMatrix and drops all series calculated from the old data
+- A lock makes it safe for dash to serve callbacks from several threads. Series are calculated outside the lock
+  and only stored if the data hasn't been refreshed in the meantime
+- With dir_cache, csv files are read through CsvRefresher from meetup057_tim_dash_plotly_refresh which keeps a
+  local copy and uses conditional requests, so refresh() only rebuilds a case type if its file has changed
+
+Series returned are shared by all callers so must not be modified (copy them first if necessary).
+
+Usage:
+    import meetup057_tim_dash_plotly_data_cache as data_cache
+    data = data_cache.DataCache()
+    series = data.series_sum_for_location("confirmed", country="Australia", state="Queensland")
+
+To install third party libraries
+
+pip install numpy pandas plotly dash
+"""
+
+# Standard libraries
+import collections
+import logging
+import threading
+# Third party libraries
+import numpy as np
+import pandas as pd
+# Local modules
+import meetup057_tim_dash_plotly_refresh as csv_refresh
+
+logger = logging.getLogger(__name__)
+
+URL_TEMPLATE = ("https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/"
+                "csse_covid_19_time_series/time_series_covid19_{case_type}_global.csv")
+CASE_TYPES = ["confirmed", "recovered", "deaths"]
+# Number of location series kept in the LRU cache
+MAX_SERIES = 1024
+# Days to average doubling rate over, calculated when data is read. Others are calculated when first asked for
+AVERAGED_DAYS = (3, 5, 7)
+
+
+def location_name(country=None, state=None):
+    locations = []
+    if state:
+        locations.append(state)
+    if country:
+        locations.append(country)
+    return " - ".join(locations) if len(locations) > 0 else "everywhere"
+
+
+def dct_doubling_days(ar_matrix, tpl_averaged_days=AVERAGED_DAYS):
+    """Days to double for every element of ar_matrix (location x date) averaged over each of tpl_averaged_days
+
+    :return: dict of averaged_days -> float64 array same shape as ar_matrix. NaN where current or previous isn't
+             positive, inf where current <= previous
+    """
+    ar_current = ar_matrix.astype(np.float64)
+    ar_log2 = np.full_like(ar_current, np.nan)
+    np.log2(ar_current, out=ar_log2, where=ar_current > 0)
+    dct_days = {}
+    for averaged_days in tpl_averaged_days:
+        if averaged_days < 1:
+            raise ValueError(f"dct_doubling_days: averaged_days must be at least 1 not {averaged_days}")
+        ar_days = np.full_like(ar_current, np.nan)
+        # log2(current / previous). NaN if either is NaN
+        ar_growth = ar_log2[:, averaged_days:] - ar_log2[:, :ar_log2.shape[1] - averaged_days]
+        ar_days_shifted = ar_days[:, averaged_days:]
+        np.divide(averaged_days, ar_growth, out=ar_days_shifted, where=ar_growth > 0)
+        ar_days_shifted[ar_growth <= 0] = np.inf
+        dct_days[averaged_days] = ar_days
+    return dct_days
+
+
+def ar_latest(ar_days, ar_row):
+    """Values on the last date for rows of ar_days. NaN if there are no dates"""
+    if ar_days.shape[1] == 0:
+        return np.full(len(ar_row), np.nan)
+    return ar_days[ar_row, -1]
+
+
+class LocationMatrix:
+    """
+    JHU wide DataFrame (one row per country/state, one column per date) aggregated once into a numpy matrix with a
+    row for every location that can be selected:
+    - (country, state) for each state
+    - (country, None) total of all rows for country
+    - (None, state) total of all rows for a state name (in case two countries have a state with the same name)
+    - (None, None) everywhere
+    """
+
+    def __init__(self, df):
+        self.index_date = pd.to_datetime(df.columns[4:], format="%m/%d/%y")
+        df_values = df.iloc[:, 4:].fillna(0).astype(np.int64)
+        sr_country, sr_state = df["Country/Region"], df["Province/State"]
+        has_state = sr_state.notna()
+        df_values_state = df_values[has_state]
+        lst_df = [
+            df_values_state.groupby([sr_country[has_state], sr_state[has_state]], sort=True).sum(),
+            df_values.groupby(sr_country, sort=True).sum(),
+            df_values_state.groupby(sr_state[has_state], sort=True).sum(),
+            df_values.sum(axis="index").to_frame().T,
+        ]
+        lst_key = ([(country, state) for country, state in lst_df[0].index]
+                   + [(country, None) for country in lst_df[1].index]
+                   + [(None, state) for state in lst_df[2].index]
+                   + [(None, None)])
+        ar_matrix = np.concatenate([df_group.to_numpy() for df_group in lst_df])
+        # int32 halves the memory of int64. Keep int64 if any total is too big for int32
+        if len(ar_matrix) == 0 or ar_matrix.max(initial=0) <= np.iinfo(np.int32).max:
+            ar_matrix = ar_matrix.astype(np.int32)
+        self.ar_matrix = ar_matrix
+        self.dct_row = {key: row for row, key in enumerate(lst_key)}
+        self.dct_states = {}
+        for country, state in lst_df[0].index:
+            self.dct_states.setdefault(country, []).append(state)
+        self.lst_countries = list(lst_df[1].index)
+        self.ar_row_country = np.array([self.dct_row[(country, None)] for country in self.lst_countries], dtype=np.intp)
+        self.dct_doubling = {}
+        self.dct_rank = {}
+        self.add_doubling_days(AVERAGED_DAYS)
+
+    def add_doubling_days(self, tpl_averaged_days):
+        """Calculate doubling days for every location and rank countries by latest doubling days"""
+        dct_days = dct_doubling_days(self.ar_matrix, tpl_averaged_days)
+        for averaged_days, ar_days in dct_days.items():
+            # Fastest doubling (fewest days) first, then inf (not growing), then NaN (unknown)
+            self.dct_rank[averaged_days] = np.argsort(ar_latest(ar_days, self.ar_row_country), kind="stable")
+            # Stored after rank so any thread finding it in dct_doubling finds its rank too
+            self.dct_doubling[averaged_days] = ar_days
+
+    def ar_doubling_days(self, averaged_days=3):
+        """Doubling days matrix (location x date), calculated if averaged_days not in AVERAGED_DAYS"""
+        if averaged_days not in self.dct_doubling:
+            self.add_doubling_days((averaged_days,))
+        return self.dct_doubling[averaged_days]
+
+    def ar_for_location(self, country=None, state=None):
+        """Row of matrix (a view, not a copy) for location. Zeros if location not found"""
+        row = self.dct_row.get((country or None, state or None))
+        if row is None:
+            return np.zeros(len(self.index_date), dtype=self.ar_matrix.dtype)
+        return self.ar_matrix[row]
+
+    def series_sum_for_location(self, country=None, state=None):
+        """Same as meetup053 series_sum_for_location(df, country, state) without filtering, summing or parsing dates"""
+        return pd.Series(self.ar_for_location(country, state), index=self.index_date)
+
+    def ar_doubling_days_for_location(self, country=None, state=None, averaged_days=3):
+        """Row of doubling days matrix for location. NaN if location not found"""
+        row = self.dct_row.get((country or None, state or None))
+        if row is None:
+            return np.full(len(self.index_date), np.nan)
+        return self.ar_doubling_days(averaged_days)[row]
+
+    def series_doubling_days_for_location(self, country=None, state=None, averaged_days=3):
+        """Series of days to double averaged over averaged_days with DatetimeIndex. NaN if location not found"""
+        return pd.Series(self.ar_doubling_days_for_location(country, state, averaged_days), index=self.index_date)
+
+    def lst_ranked_countries(self, averaged_days=3, num=None):
+        """List of (country, latest doubling days), fastest doubling first. Not growing (inf) and unknown (NaN) last"""
+        ar_days = self.ar_doubling_days(averaged_days)
+        ar_rank = self.dct_rank[averaged_days][:num]
+        ar_days_latest = ar_latest(ar_days, self.ar_row_country[ar_rank])
+        return [(self.lst_countries[i], days) for i, days in zip(ar_rank.tolist(), ar_days_latest.tolist())]
+
+    def lst_states(self, country=None):
+        """States for a country (or all state names if no country) for dropdown options"""
+        if country:
+            return self.dct_states.get(country, [])
+        return sorted({state for lst in self.dct_states.values() for state in lst})
+
+
+class DataCache:
+    """
+    JHU COVID-19 time series DataFrames for each case type plus an LRU cache of series for each location
+    """
+
+    def __init__(self, url_template=URL_TEMPLATE, max_series=MAX_SERIES, dir_cache=None):
+        """
+        :param url_template: URL (or file name) with {case_type} where confirmed, recovered or deaths goes
+        :param max_series: Maximum number of location series to keep
+        :param dir_cache: Directory for local copies of csv files kept up to date by CsvRefresher. None to read
+                          whole csv every time
+        """
+        self.url_template = url_template
+        self.max_series = max_series
+        self.dir_cache = dir_cache
+        self.dct_refresher = {}
+        self.lock = threading.RLock()
+        self.dct_df = {}
+        self.dct_matrix = {}
+        # Incremented each time a case type is read so series calculated from older data aren't stored
+        self.dct_version = collections.Counter()
+        # (case_type, country, state) -> series. Most recently used at end
+        self.od_series = collections.OrderedDict()
+        self.num_hits = 0
+        self.num_misses = 0
+
+    def read_case_type(self, case_type):
+        """Read DataFrame for case type from url_template. Override to read from elsewhere"""
+        if case_type not in CASE_TYPES:
+            raise ValueError(f"DataCache: case_type must be one of {CASE_TYPES} not {case_type}")
+        url = self.url_template.format(case_type=case_type)
+        if self.dir_cache is not None:
+            with self.lock:
+                refresher = self.dct_refresher.setdefault(case_type, csv_refresh.CsvRefresher(url, self.dir_cache))
+            return refresher.refresh()[0]
+        logger.info(f"DataCache: reading {url}")
+        return pd.read_csv(url)
+
+    def df_for_case_type(self, case_type="confirmed"):
+        """DataFrame of JHU data for case type, read the first time it is needed"""
+        with self.lock:
+            df = self.dct_df.get(case_type)
+        if df is None:
+            df = self.read_case_type(case_type)
+            with self.lock:
+                # Another thread may have read it at the same time. Keep the first one
+                df = self.dct_df.setdefault(case_type, df)
+        return df
+
+    def location_matrix(self, case_type="confirmed"):
+        """LocationMatrix for case type, built the first time it is needed"""
+        with self.lock:
+            matrix = self.dct_matrix.get(case_type)
+            version = self.dct_version[case_type]
+        if matrix is None:
+            matrix = LocationMatrix(self.df_for_case_type(case_type))
+            with self.lock:
+                if self.dct_version[case_type] == version:
+                    matrix = self.dct_matrix.setdefault(case_type, matrix)
+        return matrix
+
+    def refresh(self, case_type=None):
+        """Read case_type again (or all case types already read) and drop location series calculated from old data"""
+        with self.lock:
+            lst_case_type = [case_type] if case_type else list(self.dct_df)
+        for ct in lst_case_type:
+            df = self.read_case_type(ct)
+            with self.lock:
+                if df is self.dct_df.get(ct):
+                    # CsvRefresher returns the same DataFrame if the csv hasn't changed
+                    continue
+                self.dct_df[ct] = df
+                self.dct_matrix.pop(ct, None)
+                self.dct_version[ct] += 1
+                for key in [key for key in self.od_series if key[0] == ct]:
+                    del self.od_series[key]
+
+    def series_sum_for_location(self, case_type="confirmed", country=None, state=None):
+        """Series of daily cumulative cases for location with DatetimeIndex. Calculated once and then cached"""
+        # "" and None both mean all countries or all states
+        key = (case_type, country or None, state or None)
+        with self.lock:
+            series = self.od_series.get(key)
+            if series is not None:
+                self.od_series.move_to_end(key)
+                self.num_hits += 1
+                return series
+            self.num_misses += 1
+            version = self.dct_version[case_type]
+        series = self.location_matrix(case_type).series_sum_for_location(country=country, state=state)
+        with self.lock:
+            if self.dct_version[case_type] == version:
+                self.od_series[key] = series
+                self.od_series.move_to_end(key)
+                while len(self.od_series) > self.max_series:
+                    self.od_series.popitem(last=False)
+        return series
+
+    def series_doubling_days_for_location(self, case_type="confirmed", country=None, state=None, averaged_days=3):
+        """Series of days to double averaged over averaged_days for location. Shares the LocationMatrix"""
+        return self.location_matrix(case_type).series_doubling_days_for_location(country, state, averaged_days)
+
+    def lst_ranked_countries(self, case_type="confirmed", averaged_days=3, num=None):
+        """List of (country, latest doubling days), fastest doubling first"""
+        return self.location_matrix(case_type).lst_ranked_countries(averaged_days, num)
+
+    def cache_info(self):
+        """dict of hits, misses and current number of series in LRU cache"""
+        with self.lock:
+            return {'hits': self.num_hits, 'misses': self.num_misses, 'size': len(self.od_series),
+                    'max_series': self.max_series}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    data = DataCache()
+    for i in range(3):
+        for country in ["Australia", "New Zealand", "United Kingdom"]:
+            series = data.series_sum_for_location('confirmed', country=country)
+            print(f"{location_name(country=country)} {series.iloc[-1]}")
+    print(f"{data.series_sum_for_location('confirmed', country='Australia', state='Queensland').tail()}")
+    print(f"{data.series_doubling_days_for_location('confirmed', country='Australia', averaged_days=7).tail()}")
+    print(f"Fastest doubling {data.lst_ranked_countries('confirmed', averaged_days=7, num=10)}")
+    print(data.cache_info())
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""MeetUp 057 - Beginners' Python and Machine Learning - dash plotly figure cache
+
+Companion to meetup057_tim_dash_plotly.py and meetup057_tim_dash_plotly_data_cache.py
+
+plot_for_location in meetup053 and meetup096 builds a new make_subplots figure (cases on a log scale, doubling
+days and reference lines for doubling every 2, 3, 4, 5 and 6 days) every time it is called. In the dash app that
+is every time a user changes country, state, averaged days or starting number, and the whole figure is converted
+to JSON again for the browser.
+
+FigureCache keeps figures already built in a least recently used (LRU) cache keyed by
+(case_type, country, state, num_start, averaged_days, max_points):
+- Figures are stored already serialised (fig.to_json()) and as the dict parsed from that JSON. Returning the dict
+  from a dash callback skips plotly's validation and numpy conversion. The JSON string can be returned as is
+  from a flask route
+- Long traces can be downsampled to max_points with Largest-Triangle-Three-Buckets (LTTB), which keeps the
+  points that change the shape of the line the most, so peaks and turning points survive
+- Data come from a DataCache so series and doubling days are rows of its LocationMatrix. Figures built from data
+  which has since been refreshed are not used again
+
+Usage in dash app:
+    import meetup057_tim_dash_plotly_data_cache as data_cache
+    import meetup057_tim_dash_plotly_figure_cache as figure_cache
+    data = data_cache.DataCache()
+    figures = figure_cache.FigureCache(data, max_points=200)
+
+    @app.callback(Output("graph-doubling-days", "figure"), [Input("input-country", "value"), ...])
+    def update_graph(country, state, averaged_days, num_start):
+        return figures.figure("confirmed", country, state, num_start, averaged_days)
+
+To install third party libraries
+
+pip install numpy pandas plotly dash
+"""
+
+# Standard libraries
+import collections
+import json
+import logging
+import threading
+# Third party libraries
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.subplots
+# Local modules
+import meetup057_tim_dash_plotly_data_cache as data_cache
+
+logger = logging.getLogger(__name__)
+
+# Number of figures kept in the LRU cache
+MAX_FIGURES = 256
+# Reference lines on cases chart for doubling every 2, 3, 4, 5 and 6 days
+DOUBLERS = (2, 3, 4, 5, 6)
+# max_points not given, so use FigureCache's max_points. None means every date
+DEFAULT = object()
+
+
+def ar_idx_lttb(ar_x, ar_y, max_points):
+    """Indexes of points kept when downsampling line (ar_x, ar_y) to max_points with Largest-Triangle-Three-Buckets
+
+    First and last points are always kept. The points in between are split into max_points - 2 buckets and from
+    each bucket the point making the largest triangle with the point kept from the previous bucket and the average
+    of the next bucket is kept. Values which aren't finite (NaN, inf) count as 0 when choosing points.
+
+    :return: numpy array of indexes, all indexes if there are no more than max_points
+    """
+    num = len(ar_x)
+    if max_points >= num or max_points < 3:
+        return np.arange(num)
+    ar_x = np.asarray(ar_x, dtype=np.float64)
+    ar_y = np.asarray(ar_y, dtype=np.float64)
+    ar_y = np.where(np.isfinite(ar_y), ar_y, 0.0)
+    # Bucket boundaries for points 1 to num - 2
+    ar_edge = np.linspace(1, num - 1, max_points - 1).astype(np.intp)
+    ar_idx = np.empty(max_points, dtype=np.intp)
+    ar_idx[0], ar_idx[-1] = 0, num - 1
+    idx_prev = 0
+    for bucket in range(max_points - 2):
+        start, stop = ar_edge[bucket], ar_edge[bucket + 1]
+        # Average of next bucket (or last point for last bucket)
+        stop_next = ar_edge[bucket + 2] if bucket + 2 < len(ar_edge) else num
+        x_next, y_next = ar_x[stop:stop_next].mean(), ar_y[stop:stop_next].mean()
+        x_prev, y_prev = ar_x[idx_prev], ar_y[idx_prev]
+        # Twice the triangle area. The half doesn't change which is largest
+        ar_area = np.abs((x_prev - x_next) * (ar_y[start:stop] - y_prev)
+                         - (x_prev - ar_x[start:stop]) * (y_next - y_prev))
+        idx_prev = start + int(np.argmax(ar_area))
+        ar_idx[bucket + 1] = idx_prev
+    return ar_idx
+
+
+def downsample(index, ar_y, max_points=None):
+    """(index, ar_y) downsampled to max_points with LTTB. Unchanged if max_points is None"""
+    if max_points is None:
+        return index, ar_y
+    ar_idx = ar_idx_lttb(np.arange(len(ar_y)), ar_y, max_points)
+    return index[ar_idx], ar_y[ar_idx]
+
+
+def fig_for_location(location_matrix, country=None, state=None, num_start=100, averaged_days=3, description="",
+                     max_points=None):
+    """plot_for_location from meetup053 (challenge 11) using a LocationMatrix, optionally downsampled with LTTB"""
+    ar_current = location_matrix.ar_for_location(country, state)
+    ar_doubling = location_matrix.ar_doubling_days_for_location(country, state, averaged_days)
+    # meetup053 fails if num_start is never reached. Show all dates instead
+    ar_started = np.flatnonzero(ar_current >= num_start)
+    pos_start = ar_started[0] if len(ar_started) else 0
+    index_date = location_matrix.index_date[pos_start:]
+    ar_current, ar_doubling = ar_current[pos_start:], ar_doubling[pos_start:]
+    location = data_cache.location_name(country=country, state=state)
+    fig = plotly.subplots.make_subplots(
+        rows=3, cols=1, shared_xaxes=True,
+        specs=[[{"rowspan": 2}], [None], [{}]],
+        subplot_titles=[f"{description} cases on a logarithmic scale",
+                        f"Days to double averaged over last {averaged_days} days. Higher is better"]
+    )
+    fig.update_layout(
+        title_text=f"{description} cases {location} starting from {num_start}",
+        height=600
+    )
+    if len(ar_current) == 0:
+        return fig
+    x, y = downsample(index_date, ar_current, max_points)
+    fig.add_trace(go.Scatter(x=x, y=y, mode='lines', name=location), row=1, col=1)
+    # Doubling days is inf when not growing. Plot as gaps like meetup053 does
+    x, y = downsample(index_date, np.where(np.isfinite(ar_doubling), ar_doubling, np.nan), max_points)
+    fig.add_trace(go.Scatter(x=x, y=y, mode='lines', showlegend=False), row=3, col=1)
+    fig.update_yaxes(title_text='Cases', type='log', row=1, col=1)
+    idx_start, idx_end = index_date[0], index_date[-1]
+    duration = (idx_end - idx_start).days
+    num_start_actual = max(int(ar_current[0]), 1)
+    num_max = max(int(ar_current.max()), num_start_actual)
+    for doubler in DOUBLERS:
+        # Stop line when it reaches most cases so months of data don't stretch the log axis to 2 ** 100 and beyond
+        idx_line_end, num_end = idx_end, num_start_actual * 2 ** (duration / doubler)
+        if num_end > num_max:
+            idx_line_end = idx_start + pd.Timedelta(days=doubler * np.log2(num_max / num_start_actual)).round("min")
+            num_end = num_max
+        fig.add_trace(
+            go.Scatter(x=[idx_start, idx_line_end], y=[num_start_actual, num_end], mode='lines',
+                       name=f'every {doubler} days'),
+            row=1, col=1
+        )
+    return fig
+
+
+class FigureCache:
+    """
+    LRU cache of doubling rate figures, serialised to JSON once, built from the data in a DataCache
+    """
+
+    def __init__(self, data, max_figures=MAX_FIGURES, max_points=None):
+        """
+        :param data: DataCache from meetup057_tim_dash_plotly_data_cache
+        :param max_figures: Maximum number of figures to keep
+        :param max_points: Default maximum number of points in each trace. None to plot every date
+        """
+        self.data = data
+        self.max_figures = max_figures
+        self.max_points = max_points
+        self.lock = threading.RLock()
+        # key -> (data version, json str, dict). Most recently used at end
+        self.od_figure = collections.OrderedDict()
+        self.num_hits = 0
+        self.num_misses = 0
+
+    def cached(self, case_type="confirmed", country=None, state=None, num_start=100, averaged_days=3,
+               max_points=DEFAULT):
+        """(json str, dict) for figure, built once then cached until data for case_type is refreshed
+
+        :param max_points: Maximum number of points in each trace. None for every date, DEFAULT for self.max_points
+        """
+        if max_points is DEFAULT:
+            max_points = self.max_points
+        # "" and None both mean all countries or all states
+        key = (case_type, country or None, state or None, num_start, averaged_days, max_points)
+        with self.data.lock:
+            version = self.data.dct_version[case_type]
+        with self.lock:
+            value = self.od_figure.get(key)
+            if value is not None and value[0] == version:
+                self.od_figure.move_to_end(key)
+                self.num_hits += 1
+                return value[1:]
+            self.num_misses += 1
+        fig = fig_for_location(self.data.location_matrix(case_type), country, state, num_start, averaged_days,
+                               description=case_type.capitalize(), max_points=max_points)
+        str_json = fig.to_json()
+        value = (version, str_json, json.loads(str_json))
+        with self.lock:
+            self.od_figure[key] = value
+            self.od_figure.move_to_end(key)
+            while len(self.od_figure) > self.max_figures:
+                self.od_figure.popitem(last=False)
+        return value[1:]
+
+    def figure_json(self, case_type="confirmed", country=None, state=None, num_start=100, averaged_days=3,
+                    max_points=DEFAULT):
+        """Figure serialised as JSON str, eg for a flask route. Shared, so don't modify"""
+        return self.cached(case_type, country, state, num_start, averaged_days, max_points)[0]
+
+    def figure(self, case_type="confirmed", country=None, state=None, num_start=100, averaged_days=3,
+               max_points=DEFAULT):
+        """Figure as dict to return from a dash callback. Shared by all callers, so don't modify"""
+        return self.cached(case_type, country, state, num_start, averaged_days, max_points)[1]
+
+    def cache_info(self):
+        """dict of hits, misses and current number of figures in LRU cache"""
+        with self.lock:
+            return {'hits': self.num_hits, 'misses': self.num_misses, 'size': len(self.od_figure),
+                    'max_figures': self.max_figures}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    figures = FigureCache(data_cache.DataCache())
+    for points in [None, 200]:
+        for i in range(2):
+            print(f"{points=} {len(figures.figure_json(country='Australia', max_points=points))} bytes")
+    print(figures.cache_info())
+    go.Figure(figures.figure(country="Australia", max_points=200)).write_html("figure_cache.html", auto_open=True)
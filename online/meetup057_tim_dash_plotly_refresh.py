@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""MeetUp 057 - Beginners' Python and Machine Learning - incremental refresh of JHU COVID-19 csv
+
+Companion to meetup057_tim_dash_plotly.py and meetup057_tim_dash_plotly_data_cache.py
+
+meetup053 and meetup096 download the whole of time_series_covid19_confirmed_global.csv with pd.read_csv(url)
+every time they start. CsvRefresher keeps a local copy and only does work when the file on the server changes:
+- Requests send If-None-Match (ETag) and If-Modified-Since (Last-Modified) from the last download. If the file
+  hasn't changed the server replies 304 Not Modified with no body and the local copy is used
+- The local copy is columnar: each date column is saved in its own .npy file plus a manifest.json with the
+  location columns, dates, ETag and Last-Modified
+- JHU adds a new date column each day. When the file has changed by only adding date columns, only the new date
+  columns are parsed (read_csv usecols) and saved. To be sure nothing else changed, each line of the new file is cut
+  back to the columns already saved and the result hashed. It must match the sha256 of the last download in the
+  manifest. Otherwise (eg corrections to earlier dates, new locations, or full=True) everything is rebuilt
+
+self_check() runs refresh() against a local stand-in server (http.server) serving a synthetic csv that changes
+between requests, and checks the 304, append and rebuild paths.
+
+Usage:
+    import meetup057_tim_dash_plotly_refresh as refresh
+    refresher = refresh.CsvRefresher(url, "cache_jhu")
+    df, changed = refresher.refresh()
+
+Usage from command line:
+    python meetup057_tim_dash_plotly_refresh.py --self-check
+
+To install third party libraries
+
+pip install numpy pandas
+"""
+
+# Standard libraries
+import argparse
+import hashlib
+import http.server
+import io
+import json
+import logging
+import pathlib
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+# Third party libraries
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Columns before the date columns in JHU time series csv
+LOCATION_COLUMNS = ["Province/State", "Country/Region", "Lat", "Long"]
+MANIFEST = "manifest.json"
+
+
+def lst_locations(df):
+    """Location columns of each row as lists (NaN as None) so they can be saved in json and compared"""
+    df_location = df[LOCATION_COLUMNS].astype(object)
+    return df_location.where(df_location.notna(), None).values.tolist()
+
+
+def sha256_prefix(bytes_csv, num_drop=0):
+    """sha256 of csv with the last num_drop columns removed from every line
+
+    Date columns are plain numbers (never quoted) so the last columns can be removed without parsing. With
+    num_drop=0 this is the sha256 of the whole file.
+    """
+    sha = hashlib.sha256()
+    for line in bytes_csv.splitlines(keepends=True):
+        content = line.rstrip(b"\r\n")
+        ending = line[len(content):]
+        if num_drop:
+            content = content.rsplit(b",", num_drop)[0]
+        sha.update(content + ending)
+    return sha.hexdigest()
+
+
+class CsvRefresher:
+    """Local columnar copy of a JHU time series csv kept up to date with conditional requests"""
+
+    def __init__(self, url, dir_cache="cache_jhu", timeout=60):
+        """
+        :param url: http(s) URL of csv
+        :param dir_cache: Directory for local copies. Each URL gets its own subdirectory
+        :param timeout: Seconds to wait for server
+        """
+        self.url = url
+        self.timeout = timeout
+        self.path = pathlib.Path(dir_cache) / hashlib.sha256(url.encode()).hexdigest()[:20]
+        self.df = None
+        self.dct_manifest = None
+        # What the last refresh() did: 'not_modified', 'append' or 'rebuild'
+        self.action = None
+
+    def read_manifest(self):
+        try:
+            with open(self.path / MANIFEST) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def write_manifest(self, dct_manifest):
+        # Write to a temporary file then rename so a half written manifest is never read
+        path_tmp = self.path / (MANIFEST + ".tmp")
+        with open(path_tmp, "w") as f:
+            json.dump(dct_manifest, f)
+        path_tmp.replace(self.path / MANIFEST)
+        self.dct_manifest = dct_manifest
+
+    def df_local(self):
+        """DataFrame in the same form as pd.read_csv(url) from local copy. None if no local copy"""
+        dct_manifest = self.dct_manifest or self.read_manifest()
+        if dct_manifest is None:
+            return None
+        self.dct_manifest = dct_manifest
+        df_location = pd.DataFrame(dct_manifest['locations'], columns=LOCATION_COLUMNS)
+        lst_date = dct_manifest['dates']
+        ar_values = np.column_stack([np.load(self.path / f"{i}.npy") for i in range(len(lst_date))]) \
+            if lst_date else np.empty((len(df_location), 0), dtype=np.int64)
+        return pd.concat([df_location, pd.DataFrame(ar_values, columns=lst_date)], axis="columns")
+
+    def fetch(self, tf_conditional=True):
+        """GET url, conditional on ETag and Last-Modified of local copy. Returns (bytes or None if 304, headers)"""
+        request = urllib.request.Request(self.url)
+        dct_manifest = self.dct_manifest or self.read_manifest()
+        if tf_conditional and dct_manifest:
+            if dct_manifest.get('etag'):
+                request.add_header("If-None-Match", dct_manifest['etag'])
+            if dct_manifest.get('last_modified'):
+                request.add_header("If-Modified-Since", dct_manifest['last_modified'])
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.read(), response.headers
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return None, e.headers
+            raise
+
+    def save_columns(self, df_dates, start):
+        """Save each column of df_dates as {start}.npy, {start+1}.npy, ..."""
+        for i, (date, series) in enumerate(df_dates.items(), start=start):
+            np.save(self.path / f"{i}.npy", series.fillna(0).to_numpy(dtype=np.int64))
+
+    def refresh(self, full=False):
+        """Bring local copy up to date with URL
+
+        :param full: True to download and rebuild everything even if unchanged (eg to pick up corrections to
+                     earlier dates)
+        :return: tuple of (DataFrame like pd.read_csv(url), True if changed since last refresh)
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+        bytes_csv, headers = self.fetch(tf_conditional=not full)
+        if bytes_csv is None:
+            logger.info(f"CsvRefresher: {self.url} not modified")
+            if self.df is None:
+                self.df = self.df_local()
+            self.action = 'not_modified'
+            return self.df, False
+        dct_header = {'etag': headers.get("ETag"), 'last_modified': headers.get("Last-Modified"),
+                      'sha256': sha256_prefix(bytes_csv)}
+        dct_manifest = self.dct_manifest or self.read_manifest()
+        lst_column = pd.read_csv(io.BytesIO(bytes_csv), nrows=0).columns.tolist()
+        lst_date_new = lst_column[len(LOCATION_COLUMNS):]
+        if not full and dct_manifest and len(lst_date_new) > len(dct_manifest['dates']) \
+                and lst_date_new[:len(dct_manifest['dates'])] == dct_manifest['dates']:
+            lst_date_add = lst_date_new[len(dct_manifest['dates']):]
+            # Same header, locations and values for dates already saved, so only new dates need to be read
+            if sha256_prefix(bytes_csv, len(lst_date_add)) == dct_manifest.get('sha256'):
+                logger.info(f"CsvRefresher: {self.url} appending {len(lst_date_add)} date columns")
+                df_new = pd.read_csv(io.BytesIO(bytes_csv), usecols=lst_date_add)
+                self.save_columns(df_new[lst_date_add], start=len(dct_manifest['dates']))
+                self.write_manifest(dict(dct_manifest, dates=dct_manifest['dates'] + lst_date_add, **dct_header))
+                self.df = self.df_local()
+                self.action = 'append'
+                return self.df, True
+            logger.info(f"CsvRefresher: {self.url} earlier columns have changed so rebuilding")
+        logger.info(f"CsvRefresher: {self.url} rebuilding local copy")
+        df = pd.read_csv(io.BytesIO(bytes_csv))
+        self.save_columns(df[lst_date_new], start=0)
+        self.write_manifest({'url': self.url, 'locations': lst_locations(df), 'dates': lst_date_new, **dct_header})
+        self.df = self.df_local()
+        self.action = 'rebuild'
+        return self.df, dct_manifest is None or dct_manifest.get('sha256') != dct_header['sha256']
+
+
+def synthetic_csv(num_dates, lst_correction=(), seed=0, max_dates=100):
+    """bytes of JHU style csv with first num_dates of max_dates date columns. lst_correction of (row, date index) to
+    add 1 to"""
+    rng = np.random.default_rng(seed)
+    lst_location = [("", "Australia", -25.0, 133.0), ("Queensland", "Australia", -27.5, 153.0),
+                    ("", "Korea, South", 35.9, 127.8), ("", "Zimbabwe", -19.0, 29.2)]
+    ar_cases = np.cumsum(rng.integers(0, 50, size=(len(lst_location), max_dates)), axis=1)
+    for row, i_date in lst_correction:
+        ar_cases[row, i_date] += 1
+    lst_date = [f"{(pd.Timestamp('2020-01-22') + pd.Timedelta(days=i)):%-m/%-d/%y}" for i in range(num_dates)]
+    df = pd.DataFrame(ar_cases[:, :num_dates], columns=lst_date)
+    df_location = pd.DataFrame(lst_location, columns=LOCATION_COLUMNS).replace("", None)
+    return pd.concat([df_location, df], axis="columns").to_csv(index=False).encode()
+
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    """Serves server.bytes_csv with an ETag and answers If-None-Match with 304 like raw.githubusercontent.com"""
+
+    def do_GET(self):
+        self.server.num_requests += 1
+        etag = f'"{hashlib.sha256(self.server.bytes_csv).hexdigest()[:16]}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(self.server.bytes_csv)))
+        self.end_headers()
+        self.wfile.write(self.server.bytes_csv)
+
+    def log_message(self, format, *args):
+        logger.debug(f"StandInHandler: {format % args}")
+
+
+def self_check():
+    """refresh() against a local stand-in server for each way the csv can change. Raises AssertionError if wrong"""
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.num_requests = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/time_series.csv"
+    lst_step = [
+        ("first download", synthetic_csv(10), 'rebuild', True),
+        ("unchanged", synthetic_csv(10), 'not_modified', False),
+        ("two new dates", synthetic_csv(12), 'append', True),
+        ("correction, same dates", synthetic_csv(12, [(2, 3)]), 'rebuild', True),
+        ("correction and new date", synthetic_csv(13, [(2, 3), (0, 11)]), 'rebuild', True),
+        ("new date", synthetic_csv(14, [(2, 3), (0, 11)]), 'append', True),
+        ("new location", synthetic_csv(15, [(2, 3), (0, 11)]).replace(b"Zimbabwe", b"Zambia"), 'rebuild', True),
+    ]
+    try:
+        with tempfile.TemporaryDirectory() as dir_cache:
+            refresher = CsvRefresher(url, dir_cache)
+            for description, server.bytes_csv, action, tf_changed in lst_step:
+                df, changed = refresher.refresh()
+                assert (refresher.action, changed) == (action, tf_changed), \
+                    f"{description}: {refresher.action}, {changed} should be {action}, {tf_changed}"
+                df_expected = pd.read_csv(io.BytesIO(server.bytes_csv))
+                pd.testing.assert_frame_equal(df, df_expected, check_dtype=False, obj=description)
+                # A new refresher (eg after restart) reads the same data from the local copy
+                pd.testing.assert_frame_equal(CsvRefresher(url, dir_cache).df_local(), df_expected, check_dtype=False)
+                print(f"self_check: {description:<24s} {action}")
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert server.num_requests == len(lst_step)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MeetUp057 - keep local copy of JHU csv up to date")
+    parser.add_argument("--self-check", action="store_true", help="check refresh against a local stand-in server")
+    parser.add_argument("-l", "--log", default="INFO", action="store", help="set log level. eg: --log INFO",
+                        type=str.upper, choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"])
+    args = parser.parse_args()
+    logging.basicConfig(level=getattr(logging, args.log))
+    if args.self_check:
+        self_check()
+        raise SystemExit
+    refresher = CsvRefresher("https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/"
+                             "csse_covid_19_time_series/time_series_covid19_confirmed_global.csv")
+    df_confirmed, tf_changed = refresher.refresh()
+    print(f"{tf_changed=}\n{df_confirmed.head()}")
+    # Second refresh should be a 304 Not Modified
+    df_confirmed, tf_changed = refresher.refresh()
+    print(f"{tf_changed=}")
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""MeetUp 092 - Beginners Python and Machine Learning - Tesla SA Battery price and solar data
+
+Companion to meetup092_tim_tesla_battery_optimisation.py and meetup092_tim_tesla_battery_simulator.py
+
+MeetUp 091 and 092 read one month of 5 minute data from nemlog.com.au into a DataFrame. Backtests over years of
+data for several regions don't need the whole lot in memory at once. This module reads many monthly files (or
+URLs) a chunk at a time and yields blocks of numpy arrays. The simulator carries battery level and profit from one
+block to the next, so memory use stays the same however many years are simulated.
+
+MeetUp 091 and 092 also cache downloads with df.to_csv(filename), but every run still has to parse the text and
+dates again. df_cached saves the parsed DataFrame instead, one .npy file per column plus a manifest.json of names
+and dtypes, in a directory named from the URL. Loading memory-maps the binary arrays rather than reading them, and
+ar_cached memory-maps a single column (eg RRP) so it can go straight into the simulator without being copied.
+
+Usage:
+    import meetup092_tim_tesla_battery_data as data
+    lst_source = data.lst_month_sources("EMERASF1", datetime.date(2019, 1, 1), datetime.date(2020, 12, 31))
+    aud_profit, mwh_level, num_intervals = data.simulate_blocks(data.iter_blocks(lst_source), rrp_break=65)
+
+    df = data.df_cached("http://nemlog.com.au/api/unit/EMERASF1/20201101/20201130/csv")
+    ar_rrp = data.ar_cached("http://nemlog.com.au/api/unit/EMERASF1/20201101/20201130/csv", "RRP")
+
+To install third party libraries
+
+pip install numpy pandas scipy
+"""
+
+# Standard libraries
+import collections
+import datetime
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import shutil
+import tempfile
+# Third party libraries
+import numpy as np
+import pandas as pd
+# Local modules
+import meetup092_tim_tesla_battery_simulator as sim
+
+logger = logging.getLogger(__name__)
+
+# SETTLEMENTDATE is the date and time at the end of 5 minutes, RRP is $/MWh, SCADAVALUE is MW from solar farm
+COLUMNS = ['SETTLEMENTDATE', 'RRP', 'SCADAVALUE']
+FORMAT_SETTLEMENTDATE = "%Y-%m-%d %H:%M:%S"
+CHUNKSIZE = 50_000
+CACHE_DIR = "cache_nemlog"
+MANIFEST = "manifest.json"
+
+# One block of intervals as numpy arrays: datetime64, float64, float64
+Block = collections.namedtuple('Block', ['ar_timestamp', 'ar_rrp', 'ar_scadavalue'])
+
+
+def lst_month_sources(duid, date_start, date_finish, tf_url=False):
+    """Filenames (or nemlog.com.au URLs if tf_url) for every month from date_start to date_finish, named as in
+    meetup091 and meetup092 eg unit_emerasf1_20201101_20201130.csv"""
+    lst_source = []
+    month_start = datetime.date(date_start.year, date_start.month, 1)
+    while month_start <= date_finish:
+        month_next = datetime.date(month_start.year + month_start.month // 12, month_start.month % 12 + 1, 1)
+        str_start = month_start.strftime('%Y%m%d')
+        str_finish = (month_next - datetime.timedelta(days=1)).strftime('%Y%m%d')
+        if tf_url:
+            lst_source.append(f"http://nemlog.com.au/api/unit/{duid}/{str_start}/{str_finish}/csv")
+        else:
+            lst_source.append(f"unit_{duid.lower()}_{str_start}_{str_finish}.csv")
+        month_start = month_next
+    return lst_source
+
+
+def iter_blocks(lst_source, chunksize=CHUNKSIZE, regionid=None):
+    """Generator yielding Block(ar_timestamp, ar_rrp, ar_scadavalue) from each source (file or URL) in turn
+
+    Only chunksize rows are in memory at a time. Intervals must be in time order, one row per interval. Intervals
+    at the start of a source at or before the last one already yielded (eg the same interval at the end of one
+    monthly file and start of the next) are skipped and logged. Anything else out of order raises ValueError.
+
+    :param lst_source: list of files or URLs in time order
+    :param chunksize: Number of rows to read at a time
+    :param regionid: Only yield rows for this REGIONID eg 'QLD1'. Needed if a source has more than one region
+    """
+    dtype = {'RRP': np.float64, 'SCADAVALUE': np.float64}
+    timestamp_last = None
+    set_regionid = set()
+    for source in lst_source:
+        logger.info(f"iter_blocks: reading {source}")
+        num_skipped, tf_source_start = 0, True
+        with pd.read_csv(source, usecols=lambda column: column in COLUMNS or column == 'REGIONID', dtype=dtype,
+                         chunksize=chunksize) as reader:
+            for df_chunk in reader:
+                if regionid:
+                    if 'REGIONID' not in df_chunk:
+                        raise ValueError(f"iter_blocks: {source} has no REGIONID column to select {regionid}")
+                    df_chunk = df_chunk[df_chunk['REGIONID'] == regionid]
+                elif 'REGIONID' in df_chunk:
+                    set_regionid.update(df_chunk['REGIONID'].dropna().unique().tolist())
+                    if len(set_regionid) > 1:
+                        raise ValueError(f"iter_blocks: {source} has regions {sorted(set_regionid)}. Choose one "
+                                         f"with regionid")
+                ar_timestamp = pd.to_datetime(df_chunk['SETTLEMENTDATE'], format=FORMAT_SETTLEMENTDATE).to_numpy()
+                # Rows already yielded can only be at the start of a source, and the rest must be in time order
+                num_skip = 0
+                if tf_source_start and timestamp_last is not None:
+                    ar_new = ar_timestamp > timestamp_last
+                    num_skip = int(ar_new.argmax()) if ar_new.any() else len(ar_timestamp)
+                ar_timestamp_keep = ar_timestamp[num_skip:]
+                if len(ar_timestamp_keep) > 0:
+                    tf_source_start = False
+                    if (timestamp_last is not None and ar_timestamp_keep[0] <= timestamp_last) or \
+                            np.any(np.diff(ar_timestamp_keep) <= np.timedelta64(0)):
+                        raise ValueError(f"iter_blocks: {source} intervals not in time order (or repeated) "
+                                         f"after {timestamp_last}")
+                num_skipped += num_skip
+                block = Block(ar_timestamp_keep, df_chunk['RRP'].to_numpy()[num_skip:],
+                              df_chunk['SCADAVALUE'].to_numpy()[num_skip:])
+                if len(block.ar_timestamp) > 0:
+                    timestamp_last = block.ar_timestamp[-1]
+                    yield block
+        if num_skipped:
+            logger.info(f"iter_blocks: {source} skipped {num_skipped} intervals already read from earlier sources")
+        if tf_source_start:
+            logger.warning(f"iter_blocks: {source} has no new intervals ({regionid=})")
+
+
+def simulate_blocks(iter_block, rrp_break, rrp_gap=0, **kwargs):
+    """Run simulate() over blocks from iter_blocks, carrying battery level and profit across block boundaries
+
+    :param iter_block: iterable of Block eg iter_blocks(lst_source)
+    :param kwargs: other arguments for simulate eg mwh_capacity, mw_limit, efficiency
+    :return: tuple of (aud_profit, mwh_level, num_intervals) at the end of the last block
+    """
+    aud_profit, mwh_level, num_intervals = 0, 0, 0
+    for block in iter_block:
+        aud_profit, mwh_level, _ = sim.simulate(block.ar_rrp, rrp_break, rrp_gap, mwh_level=mwh_level,
+                                                aud_profit=aud_profit, **kwargs)
+        num_intervals += len(block.ar_rrp)
+    return aud_profit, mwh_level, num_intervals
+
+
+def path_cache(url, cache_dir=CACHE_DIR):
+    """Directory in cache_dir for url. Named from a hash of url so any url gives a valid directory name"""
+    return pathlib.Path(cache_dir) / hashlib.sha256(url.encode()).hexdigest()[:20]
+
+
+def save_cache(df, path, url=""):
+    """Save df as one .npy file per column plus manifest.json. Text columns are saved as category codes"""
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write into a temporary directory and rename, so a half written cache is never read
+    path_tmp = pathlib.Path(tempfile.mkdtemp(dir=path.parent))
+    np.save(path_tmp / "index.npy", df.index.to_numpy())
+    dct_manifest = {'url': url, 'num_rows': len(df), 'index': {'name': df.index.name, 'dtype': str(df.index.dtype),
+                                                                'file': "index.npy"},
+                    'columns': []}
+    for i, (name, series) in enumerate(df.items()):
+        dct_column = {'name': name, 'dtype': str(series.dtype), 'file': f"column_{i}.npy", 'categories': None}
+        if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_datetime64_dtype(series):
+            ar = series.to_numpy()
+        else:
+            categorical = pd.Categorical(series)
+            ar = categorical.codes
+            dct_column['categories'] = categorical.categories.tolist()
+        np.save(path_tmp / dct_column['file'], ar)
+        dct_manifest['columns'].append(dct_column)
+    with open(path_tmp / MANIFEST, "w") as f:
+        json.dump(dct_manifest, f, indent=2)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(path_tmp, path)
+
+
+def load_cache(path, mmap_mode='c'):
+    """DataFrame saved by save_cache. Raises FileNotFoundError if not cached
+
+    The index and numeric columns stay memory-mapped: pages of the .npy files are only read when used, and
+    copy=False stops pandas copying the columns into one block. mmap_mode 'c' (copy on write) means changes to the
+    DataFrame are kept in memory and never written to the cache. With 'r' the DataFrame is read only, with None
+    everything is read into memory. Text columns are rebuilt from their category codes so are in memory.
+    """
+    path = pathlib.Path(path)
+    with open(path / MANIFEST) as f:
+        dct_manifest = json.load(f)
+    dct_index = dct_manifest['index']
+    ar_index = np.load(path / dct_index['file'], mmap_mode=mmap_mode)
+    # pd.Index copies datetime64 arrays. DatetimeIndex with copy=False doesn't
+    index = pd.DatetimeIndex(ar_index, name=dct_index['name'], copy=False) if ar_index.dtype.kind == 'M' \
+        else pd.Index(ar_index, name=dct_index['name'], copy=False)
+    dct_data = {}
+    for dct_column in dct_manifest['columns']:
+        ar = np.load(path / dct_column['file'], mmap_mode=mmap_mode)
+        if dct_column['categories'] is None:
+            dct_data[dct_column['name']] = ar
+        else:
+            categorical = pd.Categorical.from_codes(ar, dct_column['categories'])
+            dct_data[dct_column['name']] = pd.Series(categorical, index=index).astype(dct_column['dtype'])
+    return pd.DataFrame(dct_data, index=index, copy=False)
+
+
+def df_cached(url, cache_dir=CACHE_DIR, index_col='SETTLEMENTDATE'):
+    """DataFrame for url from the binary cache, downloading and caching it first if it isn't there"""
+    path = path_cache(url, cache_dir)
+    try:
+        return load_cache(path)
+    except FileNotFoundError:
+        logger.info(f"Cache {path} for {url} not found so retrieving from Internet")
+        df = pd.read_csv(url, parse_dates=[index_col], index_col=index_col)
+        save_cache(df, path, url)
+        return df
+
+
+def ar_cached(url, column='RRP', cache_dir=CACHE_DIR, index_col='SETTLEMENTDATE'):
+    """One numeric column for url memory-mapped from the binary cache (read only), downloading it if necessary"""
+    path = path_cache(url, cache_dir)
+    if not (path / MANIFEST).exists():
+        df_cached(url, cache_dir, index_col)
+    with open(path / MANIFEST) as f:
+        dct_manifest = json.load(f)
+    for dct_column in dct_manifest['columns']:
+        if dct_column['name'] == column and dct_column['categories'] is None:
+            return np.load(path / dct_column['file'], mmap_mode='r')
+    raise KeyError(f"ar_cached: no numeric column {column} in cache for {url}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    # Download a year of monthly files from nemlog.com.au (skipping any already saved) then simulate over the year
+    lst_url = lst_month_sources("EMERASF1", datetime.date(2020, 1, 1), datetime.date(2020, 12, 31), tf_url=True)
+    lst_filename = lst_month_sources("EMERASF1", datetime.date(2020, 1, 1), datetime.date(2020, 12, 31))
+    for url, filename in zip(lst_url, lst_filename):
+        if not pathlib.Path(filename).exists():
+            logger.info(f"File {filename} not found so retrieving from Internet")
+            pd.read_csv(url).to_csv(filename, index=False)
+    aud_profit_year, mwh_level_year, num = simulate_blocks(iter_blocks(lst_filename), rrp_break=65, rrp_gap=10)
+    print(f"2020 {num} intervals profit ${aud_profit_year:12,.2f} final level {mwh_level_year:6.2f}MWh")
+
+    # Second time this runs, the month is loaded from the binary cache without parsing any text
+    url_month = lst_url[-1]
+    df_month = df_cached(url_month)
+    print(df_month.head())
+    aud_profit_month, mwh_level_month, _ = sim.simulate(ar_cached(url_month, 'RRP'), rrp_break=65, rrp_gap=10)
+    print(f"December 2020 profit ${aud_profit_month:12,.2f} final level {mwh_level_month:6.2f}MWh")
@@ -284,6 +284,68 @@ except FileNotFoundError:
     df.to_csv(filename)
 
 
+class BatteryTrace:
+    """
+    Records every decision made by a Battery into numpy arrays allocated up front, so recording a step is just
+    writing six numbers. Turn on with Battery.start_trace(). When a Battery isn't being traced, mwh_decide only
+    checks battery.trace is None.
+    Use df() to get a DataFrame with columns RRP, buy, sell, aud_profit, mwh_level which plot_battery can plot.
+    """
+
+    def __init__(self, num_steps=8928):
+        """
+        :param num_steps: Number of decisions to allocate space for. 8928 is a 31 day month of 5 minute intervals.
+                          Arrays double in size if more decisions are recorded
+        """
+        self.ar_timestamp = np.full(num_steps, np.datetime64('NaT'), dtype='datetime64[ns]')
+        self.ar_rrp = np.empty(num_steps)
+        self.ar_action = np.empty(num_steps, dtype=np.int8)
+        self.ar_mwh = np.empty(num_steps)
+        self.ar_mwh_level = np.empty(num_steps)
+        self.ar_aud_profit = np.empty(num_steps)
+        self.num_steps = 0
+
+    def record(self, timestamp, rrp, action, mwh, mwh_level, aud_profit):
+        """Record one decision. action is 1 sell, -1 buy, 0 hold. mwh is +ve sold to grid, -ve bought from grid"""
+        i = self.num_steps
+        if i == len(self.ar_rrp):
+            self.grow()
+        if timestamp is not None:
+            self.ar_timestamp[i] = timestamp
+        self.ar_rrp[i] = rrp
+        self.ar_action[i] = action
+        self.ar_mwh[i] = mwh
+        self.ar_mwh_level[i] = mwh_level
+        self.ar_aud_profit[i] = aud_profit
+        self.num_steps = i + 1
+
+    def grow(self):
+        """Double the size of the arrays keeping what has been recorded"""
+        for name in ['ar_timestamp', 'ar_rrp', 'ar_action', 'ar_mwh', 'ar_mwh_level', 'ar_aud_profit']:
+            ar = getattr(self, name)
+            ar_new = np.empty(max(len(ar) * 2, 1), dtype=ar.dtype)
+            ar_new[:len(ar)] = ar
+            setattr(self, name, ar_new)
+        self.ar_timestamp[self.num_steps:] = np.datetime64('NaT')
+
+    def df(self):
+        """DataFrame of recorded decisions indexed by timestamp (or step number if no timestamps were given)"""
+        n = self.num_steps
+        ar_timestamp = self.ar_timestamp[:n]
+        index = pd.RangeIndex(n) if np.isnat(ar_timestamp).all() else pd.DatetimeIndex(ar_timestamp, name='SETTLEMENTDATE')
+        ar_rrp, ar_mwh = self.ar_rrp[:n].copy(), self.ar_mwh[:n].copy()
+        return pd.DataFrame({
+            'RRP': ar_rrp,
+            'action': self.ar_action[:n].copy(),
+            'mwh': ar_mwh,
+            'buy': np.where(ar_mwh < 0, ar_rrp, np.nan),
+            'sell': np.where(ar_mwh > 0, ar_rrp, np.nan),
+            'aud_profit': ar_mwh * ar_rrp,
+            'aud_profit_cumulative': self.ar_aud_profit[:n].copy(),
+            'mwh_level': self.ar_mwh_level[:n].copy(),
+        }, index=index)
+
+
 class Battery:
     """
     A Battery object represents a battery/operator combination. For the battery it
@@ -308,7 +370,19 @@ class Battery:
         self.efficiency = efficiency
         self.mwh_level = 0
         self.aud_profit = 0
-    
+        # BatteryTrace recording each decision, or None if not tracing
+        self.trace = None
+
+    def start_trace(self, num_steps=8928):
+        """Start recording each decision in a new BatteryTrace which is returned"""
+        self.trace = BatteryTrace(num_steps)
+        return self.trace
+
+    def stop_trace(self):
+        """Stop recording decisions and return the BatteryTrace (or None if wasn't tracing)"""
+        trace, self.trace = self.trace, None
+        return trace
+
     def mwh_charge(self, duration_minutes, pc_rate=1):
         """Instruction for battery to charge for the specified number of minutes at a percentage (pc_rate) of its maximum rate"""
         # capacity left for charging. mwh is a local variable not an instance variable
@@ -320,8 +394,10 @@ class Battery:
         mwh = min(max(mwh, 0), mwh_max)
         # adjust the battery level by the MWh to be stored in battery
         self.mwh_level += mwh
-        mw = mwh / self.efficiency / duration_minutes * 60
-        logging.debug(f"After charging at {mw:6.2f}MW for {duration_minutes}minutes, the battery level is {self.mwh_level:6.2f}MWh")
+        # f-strings are formatted before logging.debug is called, so check first to save formatting every step
+        if logging.root.isEnabledFor(logging.DEBUG):
+            mw = mwh / self.efficiency / duration_minutes * 60
+            logging.debug(f"After charging at {mw:6.2f}MW for {duration_minutes}minutes, the battery level is {self.mwh_level:6.2f}MWh")
         # return the MWh purchased from the grid
         return mwh / self.efficiency
 
@@ -338,22 +414,31 @@ class Battery:
         mwh = min(max(mwh, 0), mwh_max)
         # adjust the battery level
         self.mwh_level -= mwh
+        if logging.root.isEnabledFor(logging.DEBUG):
+            mw = mwh / duration_minutes * 60
+            logging.debug(f"After discharging at {mw:6.2f}MW for {duration_minutes}minutes, the battery level is {self.mwh_level:6.2f}MWh")
         # return the charge amount in MWh
-        mw = mwh / duration_minutes * 60
-        logging.debug(f"After discharging at {mw:6.2f}MW for {duration_minutes}minutes, the battery level is {self.mwh_level:6.2f}MWh")
         return mwh
 
-    def mwh_decide(self, rrp, rrp_break, duration_minutes):
-        """Instruction for battery to look at current price and charge or discharge"""
+    def mwh_decide(self, rrp, rrp_break, duration_minutes, timestamp=None):
+        """Instruction for battery to look at current price and charge or discharge
+
+        timestamp is only used to label the decision if tracing (see start_trace)"""
         if rrp > rrp_break:
+            action = 1
             mwh = self.mwh_discharge(duration_minutes)
         elif rrp < rrp_break * self.efficiency:
+            action = -1
             mwh = -self.mwh_charge(duration_minutes)
         else:
+            action = 0
             mwh = 0
         self.aud_profit += mwh * rrp
+        if self.trace is not None:
+            self.trace.record(timestamp, rrp, action, mwh, self.mwh_level, self.aud_profit)
         # logging.INFO = 20, logging.DEBUG = 10. Can add logging levels 
-        logging.log(15, f"After Grid change of {mwh:6.2f}MWh at RRP ${rrp:8,.2f}/MWh, profit is ${self.aud_profit:10,.2f}, level is {self.mwh_level:6.2f}MW")
+        if logging.root.isEnabledFor(15):
+            logging.log(15, f"After Grid change of {mwh:6.2f}MWh at RRP ${rrp:8,.2f}/MWh, profit is ${self.aud_profit:10,.2f}, level is {self.mwh_level:6.2f}MW")
         return mwh
 
 
@@ -445,17 +530,23 @@ plot_battery(df_for_plot=df)
 
 
 # Solution 4
-def mwh_decide(self, rrp, rrp_break, duration_minutes, rrp_gap=0):
+def mwh_decide(self, rrp, rrp_break, duration_minutes, rrp_gap=0, timestamp=None):
     """Instruction for battery to look at current price and charge or discharge"""
     if rrp > rrp_break + rrp_gap:
+        action = 1
         mwh = self.mwh_discharge(duration_minutes)
     elif rrp < rrp_break * self.efficiency:
+        action = -1
         mwh = -self.mwh_charge(duration_minutes)
     else:
+        action = 0
         mwh = 0
     self.aud_profit += mwh * rrp
+    if self.trace is not None:
+        self.trace.record(timestamp, rrp, action, mwh, self.mwh_level, self.aud_profit)
     # logging.INFO = 20, logging.DEBUG = 10
-    logging.log(15, f"After Grid change of {mwh:6.2f}MWh at RRP ${rrp:8,.2f}/MWh, break ${rrp_break:6,.2f}/MWh, gap ${rrp_gap:6,.2f}/MWh, profit is ${self.aud_profit:10,.2f}, level is {self.mwh_level:6.2f}MW")
+    if logging.root.isEnabledFor(15):
+        logging.log(15, f"After Grid change of {mwh:6.2f}MWh at RRP ${rrp:8,.2f}/MWh, break ${rrp_break:6,.2f}/MWh, gap ${rrp_gap:6,.2f}/MWh, profit is ${self.aud_profit:10,.2f}, level is {self.mwh_level:6.2f}MW")
     return mwh
 
 
@@ -494,3 +585,40 @@ print(f"Optimising result using differential_evolution and two parameters")
 result = opt.differential_evolution(loss_function_for_rrp_break_and_gap, bounds=[(20, 100), (-20, 80)])
 print(f"Optimisation result {result}")
 plot_battery(df_for_plot=df)
+
+# Rather than writing df.at[...] cells in the loop, a battery can record its own decisions with start_trace.
+# Tracing is off unless started, so the optimisations above did no recording (or log formatting) at all
+battery_traced = Battery(mwh_capacity=129, mw_limit=100)
+trace = battery_traced.start_trace(len(df))
+for timestamp, rrp in zip(df.index, df['RRP']):
+    battery_traced.mwh_decide(rrp, rrp_break=result.x[0], duration_minutes=5, rrp_gap=result.x[1], timestamp=timestamp)
+battery_traced.stop_trace()
+print(trace.df().head())
+plot_battery(df_for_plot=trace.df())
+
+# The loss functions above walk the month one row at a time writing five df.at[...] cells per row, so every
+# optimisation takes minutes. meetup092_tim_tesla_battery_simulator.py does the same calculation on a numpy array
+# of prices, calculating all the buy/sell decisions at once and only building the columns at the end
+import meetup092_tim_tesla_battery_simulator as sim
+
+ar_rrp = df['RRP'].to_numpy(dtype=np.float64)
+print(f"Optimising result using differential_evolution, two parameters and the array simulator")
+result = opt.differential_evolution(sim.loss_function_for_rrp_break_and_gap, bounds=[(20, 100), (-20, 80)], args=(ar_rrp,))
+print(f"Optimisation result {result}")
+plot_battery(df_for_plot=sim.df_simulate(df, rrp_break=result.x[0], rrp_gap=result.x[1]))
+
+# differential_evolution can also send the whole population of each generation in one call with vectorized=True.
+# sim.loss_function_vectorized simulates all candidates together in a single pass over the prices
+print(f"Optimising result using differential_evolution with the whole population simulated at once")
+result = opt.differential_evolution(sim.loss_function_vectorized, bounds=[(20, 100), (-20, 80)], args=(ar_rrp,),
+                                    vectorized=True, updating='deferred')
+print(f"Optimisation result {result}")
+
+# The rrp_break and rrp_gap strategy is a heuristic. How much profit is it leaving on the table?
+# sim.optimal_dispatch finds the best possible buying and selling with dynamic programming (achievable by a battery)
+# and sim.aud_profit_upper_bound uses linear programming to find a profit no strategy can beat
+aud_profit_optimal, mwh_level_optimal, dct_optimal = sim.optimal_dispatch(ar_rrp, rrp_final=result.x[0])
+print(f"Strategy rrp_break={result.x[0]:6.2f} rrp_gap={result.x[1]:6.2f} profit incl storage ${-result.fun:12,.2f}")
+print(f"Optimal dispatch                           profit incl storage ${aud_profit_optimal + mwh_level_optimal * result.x[0]:12,.2f}")
+print(f"Upper bound                                profit incl storage ${sim.aud_profit_upper_bound(ar_rrp, rrp_final=result.x[0]):12,.2f}")
+plot_battery(df_for_plot=df.assign(**dct_optimal))
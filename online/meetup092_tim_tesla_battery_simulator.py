@@ -0,0 +1,457 @@
+#!/usr/bin/env python3
+"""MeetUp 092 - Beginners Python and Machine Learning - Tesla SA Battery simulator
+
+Companion to meetup092_tim_tesla_battery_optimisation.py
+
+The loss functions in MeetUp 092 walk the whole month one row at a time with `for idx in df.index`, call
+Battery.mwh_decide and write five `df.at[...]` cells per row. Every evaluation by the optimiser repeats this so
+a single Nelder-Mead run does millions of scalar pandas writes.
+
+This module runs the same charge/discharge/efficiency rules over a numpy array of RRP values instead:
+- decisions to buy, sell or hold are calculated for all intervals at once using numpy comparisons
+- battery level and profit are carried through a single pass over plain python floats, visiting only
+  the intervals where the battery is asked to buy or sell. Arithmetic is done in the same order as
+  Battery.mwh_charge and Battery.mwh_discharge so results match the Battery class exactly
+- the per interval columns (mwh, aud_profit, mwh_level, buy, sell) are built as numpy arrays at the end
+
+Usage:
+    import meetup092_tim_tesla_battery_simulator as sim
+    aud_profit, mwh_level, dct_columns = sim.simulate(df['RRP'].to_numpy(), rrp_break=65, rrp_gap=10)
+    df = df.assign(**dct_columns)
+
+    fleet = sim.BatteryFleet(mwh_capacity=[129, 194], mw_limit=[100, 150], rrp_break=65, rrp_gap=10)
+    ar_aud_fleet = fleet.run(df['RRP'].to_numpy())
+    df_assets = fleet.df_assets()
+
+To install third party libraries
+
+pip install numpy pandas scipy
+"""
+
+# Standard libraries
+import logging
+# Third party libraries
+import numpy as np
+import pandas as pd
+import scipy.optimize as opt
+import scipy.sparse
+from numpy.lib.stride_tricks import sliding_window_view
+
+logger = logging.getLogger(__name__)
+
+# Tesla battery for South Australia, capacity 129 MWh, throughput 100 MW (see meetup092)
+MWH_CAPACITY = 129
+MW_LIMIT = 100
+EFFICIENCY = 0.9
+DURATION_MINUTES = 5
+
+# Number of intervals for which BatteryFleet.run calculates decisions at once
+BLOCK_INTERVALS = 1024
+
+# Actions decided for each interval
+SELL = 1
+HOLD = 0
+BUY = -1
+
+
+def ar_decide(ar_rrp, rrp_break, rrp_gap=0, efficiency=EFFICIENCY):
+    """Vectorised version of the decision in Battery.mwh_decide. Returns SELL, BUY or HOLD for every price"""
+    ar_action = np.full(ar_rrp.shape, HOLD, dtype=np.int8)
+    ar_action[ar_rrp < rrp_break * efficiency] = BUY
+    # Selling is checked first in mwh_decide so it wins if both are true (only possible with a negative gap)
+    ar_action[ar_rrp > rrp_break + rrp_gap] = SELL
+    return ar_action
+
+
+def simulate(ar_rrp, rrp_break, rrp_gap=0, mwh_capacity=MWH_CAPACITY, mw_limit=MW_LIMIT, efficiency=EFFICIENCY,
+             duration_minutes=DURATION_MINUTES, mwh_level=0, aud_profit=0):
+    """Simulate Battery.mwh_decide over every price in ar_rrp in one array backed pass
+
+    :param ar_rrp: RRP for each interval $/MWh. Anything numpy can convert to a float64 array eg df['RRP']
+    :param rrp_break: Sell above rrp_break + rrp_gap, buy below rrp_break * efficiency
+    :param rrp_gap: Additional difference between minimum sell and maximum buy price
+    :param mwh_capacity: Full number of MWh battery can store after all charging and discharging losses
+    :param mw_limit: Maximum rate MW battery can send power to/from the grid
+    :param efficiency: Round trip efficiency of charging and discharging battery. 0.9 = 90%
+    :param duration_minutes: Length of each interval
+    :param mwh_level: Battery level at start of simulation
+    :param aud_profit: Profit at start of simulation
+    :return: tuple of (aud_profit, mwh_level, dct_columns) where aud_profit and mwh_level are the values at the
+        end of the simulation and dct_columns is a dict of numpy arrays, one value per interval, for
+        'mwh' (+ve sold to grid, -ve bought from grid), 'aud_profit', 'mwh_level', 'buy' and 'sell'
+    """
+    ar_rrp = np.asarray(ar_rrp, dtype=np.float64)
+    ar_action = ar_decide(ar_rrp, rrp_break, rrp_gap, efficiency)
+    # Same expressions as Battery.mwh_charge and Battery.mwh_discharge with pc_rate=1
+    mwh_max_charge = mw_limit * 1 * efficiency * duration_minutes / 60
+    mwh_max_discharge = mw_limit * 1 * duration_minutes / 60
+    # Holding doesn't change level or profit so only visit intervals where we buy or sell
+    ar_idx = np.flatnonzero(ar_action)
+    mwh_level_start = mwh_level
+    lst_mwh = [0.0] * len(ar_idx)
+    lst_level = [0.0] * len(ar_idx)
+    for i, (rrp, action) in enumerate(zip(ar_rrp[ar_idx].tolist(), ar_action[ar_idx].tolist())):
+        if action == SELL:
+            mwh = min(max(mwh_level, 0), mwh_max_discharge)
+            mwh_level -= mwh
+        else:
+            mwh = min(max(mwh_capacity - mwh_level, 0), mwh_max_charge)
+            mwh_level += mwh
+            mwh = -(mwh / efficiency)
+        aud_profit += mwh * rrp
+        lst_mwh[i] = mwh
+        lst_level[i] = mwh_level
+    return aud_profit, mwh_level, dct_columns_from_steps(ar_rrp, ar_idx, lst_mwh, lst_level, mwh_level_start)
+
+
+def dct_columns_from_steps(ar_rrp, ar_idx, lst_mwh, lst_level, mwh_level_start):
+    """Expand values calculated at buy or sell intervals ar_idx to columns with a value for every interval"""
+    ar_mwh = np.zeros(len(ar_rrp))
+    ar_mwh[ar_idx] = lst_mwh
+    # Level only changes when buying or selling so carry forward the last level (or the starting level)
+    ar_level_at_step = np.array([mwh_level_start] + lst_level, dtype=np.float64)
+    ar_pos = np.zeros(len(ar_rrp), dtype=np.int64)
+    ar_pos[ar_idx] = np.arange(1, len(ar_idx) + 1)
+    ar_level = ar_level_at_step[np.maximum.accumulate(ar_pos)]
+    return {
+        'mwh': ar_mwh,
+        'aud_profit': ar_mwh * ar_rrp,
+        'mwh_level': ar_level,
+        'buy': np.where(ar_mwh < 0, ar_rrp, np.nan),
+        'sell': np.where(ar_mwh > 0, ar_rrp, np.nan),
+    }
+
+
+def loss_function_for_rrp_break_and_gap(array_x, ar_rrp, mwh_capacity=MWH_CAPACITY, mw_limit=MW_LIMIT,
+                                        efficiency=EFFICIENCY):
+    """Same loss as meetup092 loss_function_for_rrp_break_and_gap (or loss_function_for_rrp_break if only one
+    value in array_x) but using simulate. Pass ar_rrp to the optimiser with args=(ar_rrp,)"""
+    rrp_break = array_x[0]
+    rrp_gap = array_x[1] if len(array_x) > 1 else 0
+    aud_profit, mwh_level, _ = simulate(ar_rrp, rrp_break, rrp_gap, mwh_capacity=mwh_capacity, mw_limit=mw_limit,
+                                       efficiency=efficiency)
+    return -(aud_profit + mwh_level * rrp_break)
+
+
+def df_simulate(df, rrp_break, rrp_gap=0, **kwargs):
+    """Copy of df with columns from simulate added, ready for plot_battery from meetup091/meetup092"""
+    aud_profit, mwh_level, dct_columns = simulate(df['RRP'].to_numpy(), rrp_break, rrp_gap, **kwargs)
+    logger.info(f"RRP break point ${rrp_break:7,.2f}/MWh, gap ${rrp_gap:7,.2f}/MW. Profit ${aud_profit:10,.2f}, level {mwh_level:6.2f}MWh")
+    return df.assign(**dct_columns)
+
+
+class BatteryFleet:
+    """
+    Many batteries trading at the same prices, each with its own mwh_capacity, mw_limit, efficiency and
+    rrp_break/rrp_gap strategy, eg a portfolio of storage assets.
+
+    Rather than a list of Battery objects, a BatteryFleet keeps a numpy array for each instance variable with one
+    value per battery (a struct of arrays). run() advances every battery through each interval with a few numpy
+    operations, so a fleet of 1000 batteries costs about the same per interval as a handful of Battery objects.
+    Each battery gets exactly the same result as simulate() would give it.
+    """
+
+    def __init__(self, mwh_capacity=MWH_CAPACITY, mw_limit=MW_LIMIT, efficiency=EFFICIENCY, rrp_break=65,
+                 rrp_gap=0, mwh_level=0, aud_profit=0):
+        """
+        Constructor of BatteryFleet objects. Each parameter is an array with one value per battery or a single
+        value for all batteries. At least one must be an array to say how many batteries are in the fleet.
+
+        :param mwh_capacity: Full number of MWh each battery can store after all charging and discharging losses
+        :param mw_limit: Maximum rate MW each battery can send power to/from the grid
+        :param efficiency: Round trip efficiency of charging and discharging each battery. 0.9 = 90%
+        :param rrp_break: Each battery sells above rrp_break + rrp_gap and buys below rrp_break * efficiency
+        :param rrp_gap: Additional difference between minimum sell and maximum buy price
+        :param mwh_level: Starting level of each battery
+        :param aud_profit: Starting profit of each battery
+        """
+        lst_ar = np.broadcast_arrays(*[np.asarray(value, dtype=np.float64) for value in
+                                       [mwh_capacity, mw_limit, efficiency, rrp_break, rrp_gap, mwh_level, aud_profit]])
+        # Copies so that each fleet has its own writable arrays
+        (self.ar_mwh_capacity, self.ar_mw_limit, self.ar_efficiency, self.ar_rrp_break, self.ar_rrp_gap,
+         self.ar_mwh_level, self.ar_aud_profit) = [np.atleast_1d(ar).copy() for ar in lst_ar]
+
+    def __len__(self):
+        return len(self.ar_mwh_level)
+
+    def run(self, ar_rrp, duration_minutes=DURATION_MINUTES):
+        """Advance every battery through each interval of ar_rrp, carrying on from current levels and profits
+
+        :param ar_rrp: RRP for each interval $/MWh
+        :param duration_minutes: Length of each interval
+        :return: numpy array of fleet profit from buying and selling in each interval (sum over all batteries)
+        """
+        ar_rrp = np.asarray(ar_rrp, dtype=np.float64)
+        num = len(self)
+        # Local names for arrays used every interval
+        mwh_capacity, efficiency = self.ar_mwh_capacity, self.ar_efficiency
+        ar_level, ar_profit = self.ar_mwh_level, self.ar_aud_profit
+        # Same expressions as Battery.mwh_charge and Battery.mwh_discharge with pc_rate=1
+        mwh_max_charge = self.ar_mw_limit * 1 * efficiency * duration_minutes / 60
+        mwh_max_discharge = self.ar_mw_limit * 1 * duration_minutes / 60
+        ar_sell_above = self.ar_rrp_break + self.ar_rrp_gap
+        ar_buy_below = self.ar_rrp_break * efficiency
+        ar_aud_fleet = np.empty(len(ar_rrp))
+        # Working arrays reused every interval so numpy doesn't allocate memory inside the loop
+        ar_sell_mwh, ar_buy_mwh, ar_mwh = np.empty(num), np.empty(num), np.empty(num)
+        for idx_block in range(0, len(ar_rrp), BLOCK_INTERVALS):
+            ar_rrp_block = ar_rrp[idx_block:idx_block + BLOCK_INTERVALS]
+            # 1.0 for batteries selling (buying) in each interval, 0.0 otherwise, calculated for a block of intervals
+            ar_sell_block = (ar_rrp_block[:, np.newaxis] > ar_sell_above).astype(np.float64)
+            # Selling is checked first in mwh_decide so don't buy if also selling
+            ar_buy_block = ((ar_rrp_block[:, np.newaxis] < ar_buy_below) & (ar_sell_block == 0)).astype(np.float64)
+            # Batteries buying or selling. Holding batteries' profit isn't touched, as in simulate(), so a NaN price
+            # (which is never above or below a break) doesn't make profit NaN through 0 * NaN
+            ar_trade_block = (ar_sell_block + ar_buy_block) > 0
+            for idx, (rrp, ar_sell, ar_buy, ar_trade) in enumerate(
+                    zip(ar_rrp_block.tolist(), ar_sell_block, ar_buy_block, ar_trade_block), start=idx_block):
+                # Amounts each battery would sell or buy. max(level, 0) as in simulate() for a negative starting level
+                np.maximum(ar_level, 0, out=ar_sell_mwh)
+                np.minimum(ar_sell_mwh, mwh_max_discharge, out=ar_sell_mwh)
+                np.subtract(mwh_capacity, ar_level, out=ar_buy_mwh)
+                np.maximum(ar_buy_mwh, 0, out=ar_buy_mwh)
+                np.minimum(ar_buy_mwh, mwh_max_charge, out=ar_buy_mwh)
+                # Multiplying by 1.0 or 0.0 selects the amount without changing it so results match simulate()
+                ar_sell_mwh *= ar_sell
+                ar_buy_mwh *= ar_buy
+                ar_level -= ar_sell_mwh
+                ar_level += ar_buy_mwh
+                np.divide(ar_buy_mwh, efficiency, out=ar_mwh)
+                np.subtract(ar_sell_mwh, ar_mwh, out=ar_mwh)
+                np.multiply(ar_mwh, rrp, out=ar_mwh, where=ar_trade)
+                ar_profit += ar_mwh
+                ar_aud_fleet[idx] = ar_mwh.sum()
+        return ar_aud_fleet
+
+    def df_assets(self):
+        """DataFrame with one row per battery of its parameters, profit and level"""
+        return pd.DataFrame({
+            'mwh_capacity': self.ar_mwh_capacity,
+            'mw_limit': self.ar_mw_limit,
+            'efficiency': self.ar_efficiency,
+            'rrp_break': self.ar_rrp_break,
+            'rrp_gap': self.ar_rrp_gap,
+            'aud_profit': self.ar_aud_profit,
+            'mwh_level': self.ar_mwh_level,
+            'aud_profit_incl_storage': self.ar_aud_profit + self.ar_mwh_level * self.ar_rrp_break,
+        })
+
+    def dct_totals(self):
+        """Aggregate profit, level and capacity for the whole fleet"""
+        return {
+            'num_batteries': len(self),
+            'mwh_capacity': float(self.ar_mwh_capacity.sum()),
+            'aud_profit': float(self.ar_aud_profit.sum()),
+            'mwh_level': float(self.ar_mwh_level.sum()),
+            'aud_profit_incl_storage': float((self.ar_aud_profit + self.ar_mwh_level * self.ar_rrp_break).sum()),
+        }
+
+
+def simulate_batch(ar_rrp, ar_rrp_break, ar_rrp_gap=0, mwh_capacity=MWH_CAPACITY, mw_limit=MW_LIMIT,
+                   efficiency=EFFICIENCY, duration_minutes=DURATION_MINUTES):
+    """Simulate many batteries at once, one for each (rrp_break, rrp_gap) candidate, over the same prices
+
+    The candidates are run as a BatteryFleet so the price series is only walked once however many candidates
+    there are. Each candidate gets exactly the same result as simulate() would give it.
+
+    :param ar_rrp: RRP for each interval $/MWh
+    :param ar_rrp_break: rrp_break for each candidate, shape (N,)
+    :param ar_rrp_gap: rrp_gap for each candidate, shape (N,) or a single value for all candidates
+    :param mwh_capacity: single value or one per candidate
+    :param mw_limit: single value or one per candidate
+    :param efficiency: single value or one per candidate
+    :param duration_minutes: Length of each interval
+    :return: tuple of numpy arrays (ar_aud_profit, ar_mwh_level) with final values for each candidate
+    """
+    fleet = BatteryFleet(mwh_capacity=mwh_capacity, mw_limit=mw_limit, efficiency=efficiency,
+                         rrp_break=ar_rrp_break, rrp_gap=ar_rrp_gap)
+    fleet.run(ar_rrp, duration_minutes)
+    return fleet.ar_aud_profit, fleet.ar_mwh_level
+
+
+def loss_function_batch(ar_x, ar_rrp, mwh_capacity=MWH_CAPACITY, mw_limit=MW_LIMIT, efficiency=EFFICIENCY):
+    """Loss for an (N, 2) matrix of (rrp_break, rrp_gap) candidates (or (N, 1) of rrp_break). Returns shape (N,)"""
+    ar_x = np.atleast_2d(ar_x)
+    ar_rrp_break = ar_x[:, 0]
+    ar_rrp_gap = ar_x[:, 1] if ar_x.shape[1] > 1 else 0
+    ar_profit, ar_level = simulate_batch(ar_rrp, ar_rrp_break, ar_rrp_gap, mwh_capacity=mwh_capacity,
+                                         mw_limit=mw_limit, efficiency=efficiency)
+    return -(ar_profit + ar_level * ar_rrp_break)
+
+
+def loss_function_vectorized(x, ar_rrp, mwh_capacity=MWH_CAPACITY, mw_limit=MW_LIMIT, efficiency=EFFICIENCY):
+    """Loss for scipy.optimize.differential_evolution(..., vectorized=True, updating='deferred')
+
+    differential_evolution sends x with shape (number of parameters, number of candidates) so transpose it.
+    Polishing the result at the end sends one candidate at a time which is quicker without batching"""
+    if np.ndim(x) == 1:
+        return loss_function_for_rrp_break_and_gap(x, ar_rrp, mwh_capacity=mwh_capacity, mw_limit=mw_limit,
+                                                   efficiency=efficiency)
+    return loss_function_batch(np.asarray(x).T, ar_rrp, mwh_capacity=mwh_capacity, mw_limit=mw_limit,
+                               efficiency=efficiency)
+
+
+def optimal_dispatch(ar_rrp, mwh_capacity=MWH_CAPACITY, mw_limit=MW_LIMIT, efficiency=EFFICIENCY,
+                     duration_minutes=DURATION_MINUTES, mwh_step=None, rrp_final=0):
+    """Best possible buying and selling for a price series using dynamic programming
+
+    Battery level is discretised into steps of mwh_step MWh. Working backwards from the last interval, the best
+    value from each level is the best of holding, charging up to mw_limit or discharging up to mw_limit into any
+    level the battery can reach in one interval. Each interval is a handful of numpy operations over all levels
+    so cost is O(T * levels). Like Battery, each interval either charges or discharges, never both.
+
+    The schedule found can be followed by a real battery so its profit is achievable. It is slightly below the
+    continuous optimum because levels are discretised. See aud_profit_upper_bound for a bound from above.
+
+    :param ar_rrp: RRP for each interval $/MWh
+    :param mwh_capacity: Full number of MWh battery can store after all charging and discharging losses
+    :param mw_limit: Maximum rate MW battery can send power to/from the grid
+    :param efficiency: Round trip efficiency of charging and discharging battery. 0.9 = 90%
+    :param duration_minutes: Length of each interval
+    :param mwh_step: Size of each discretised level. Default is a tenth of the maximum discharge per interval
+    :param rrp_final: $/MWh value of energy left in battery at the end (loss functions use rrp_break)
+    :return: tuple of (aud_profit, mwh_level, dct_columns) the same as simulate()
+    """
+    ar_rrp = np.asarray(ar_rrp, dtype=np.float64)
+    num_intervals = len(ar_rrp)
+    mwh_max_charge = mw_limit * 1 * efficiency * duration_minutes / 60
+    mwh_max_discharge = mw_limit * 1 * duration_minutes / 60
+    if mwh_step is None:
+        mwh_step = mwh_max_discharge / 10
+    # Small tolerance so rates which are exact multiples of mwh_step (eg efficiency 0.9) aren't rounded down
+    num_levels = int(mwh_capacity / mwh_step + 1e-9) + 1
+    steps_charge = int(mwh_max_charge / mwh_step + 1e-9)
+    steps_discharge = int(mwh_max_discharge / mwh_step + 1e-9)
+    ar_mwh_levels = np.arange(num_levels) * mwh_step
+    ar_idx = np.arange(num_levels)
+    # Level to move to from each level in each interval. int16 keeps a year of 5 minute intervals small
+    ar_next = np.empty((num_intervals, num_levels), dtype=np.int16 if num_levels < 2 ** 15 else np.int32)
+    ar_value = ar_mwh_levels * rrp_final
+    # Padding with -inf means windows running off either end of the levels are never chosen
+    ar_buy_pad = np.full(num_levels + steps_charge, -np.inf)
+    ar_sell_pad = np.full(num_levels + steps_discharge, -np.inf)
+    # Each row of a window view is the levels reachable from one level, without copying any data
+    ar_buy_window = sliding_window_view(ar_buy_pad, steps_charge + 1)
+    ar_sell_window = sliding_window_view(ar_sell_pad, steps_discharge + 1)
+    for t in range(num_intervals - 1, -1, -1):
+        rrp = ar_rrp[t]
+        # Moving from level i to level j is worth value[j] - (j - i) * mwh_step * price. Split into a part only
+        # depending on j (which goes in the window) and a part only depending on i (added after)
+        rrp_buy = rrp / efficiency
+        np.subtract(ar_value, ar_mwh_levels * rrp_buy, out=ar_buy_pad[:num_levels])
+        np.subtract(ar_value, ar_mwh_levels * rrp, out=ar_sell_pad[steps_discharge:])
+        ar_buy_best = ar_buy_window.argmax(axis=1)
+        ar_sell_best = ar_sell_window.argmax(axis=1)
+        ar_buy_value = ar_buy_window[ar_idx, ar_buy_best] + ar_mwh_levels * rrp_buy
+        ar_sell_value = ar_sell_window[ar_idx, ar_sell_best] + ar_mwh_levels * rrp
+        tf_buy = ar_buy_value >= ar_sell_value
+        ar_value = np.where(tf_buy, ar_buy_value, ar_sell_value)
+        ar_next[t] = np.where(tf_buy, ar_idx + ar_buy_best, ar_idx - steps_discharge + ar_sell_best)
+    # Follow the best decisions forward from an empty battery
+    ar_level_idx = np.empty(num_intervals, dtype=np.int64)
+    idx = 0
+    for t in range(num_intervals):
+        idx = ar_next[t, idx]
+        ar_level_idx[t] = idx
+    ar_mwh_stored = np.diff(ar_level_idx, prepend=0) * mwh_step
+    # Stored energy costs mwh / efficiency from the grid, the same as Battery.mwh_charge
+    ar_mwh = np.where(ar_mwh_stored > 0, -ar_mwh_stored / efficiency, -ar_mwh_stored)
+    lst_level = (ar_level_idx * mwh_step).tolist()
+    aud_profit = float(np.dot(ar_mwh, ar_rrp))
+    mwh_level = lst_level[-1] if lst_level else 0
+    return aud_profit, mwh_level, dct_columns_from_steps(ar_rrp, np.arange(num_intervals), ar_mwh.tolist(), lst_level, 0)
+
+
+def aud_profit_upper_bound(ar_rrp, mwh_capacity=MWH_CAPACITY, mw_limit=MW_LIMIT, efficiency=EFFICIENCY,
+                           duration_minutes=DURATION_MINUTES, rrp_final=0):
+    """Upper bound on profit from any strategy using a sparse linear program (scipy.optimize.linprog with HiGHS)
+
+    Variables are energy charged, energy discharged and level for every interval, linked by
+    level[t] = level[t-1] + charged[t] - discharged[t]. Levels are continuous and the program may charge and
+    discharge in the same interval, which Battery can't, so no strategy can make more than this.
+    """
+    ar_rrp = np.asarray(ar_rrp, dtype=np.float64)
+    num_intervals = len(ar_rrp)
+    mwh_max_charge = mw_limit * 1 * efficiency * duration_minutes / 60
+    mwh_max_discharge = mw_limit * 1 * duration_minutes / 60
+    # linprog minimises so use loss = cost of buying - revenue from selling - value of energy left at end
+    ar_loss = np.concatenate([ar_rrp / efficiency, -ar_rrp, np.zeros(num_intervals)])
+    ar_loss[-1] -= rrp_final
+    identity = scipy.sparse.identity(num_intervals, format='csr')
+    previous = scipy.sparse.eye(num_intervals, k=-1, format='csr')
+    a_eq = scipy.sparse.hstack([-identity, identity, identity - previous], format='csr')
+    bounds = [(0, mwh_max_charge)] * num_intervals + [(0, mwh_max_discharge)] * num_intervals + [(0, mwh_capacity)] * num_intervals
+    result = opt.linprog(ar_loss, A_eq=a_eq, b_eq=np.zeros(num_intervals), bounds=bounds, method='highs')
+    if not result.success:
+        raise ValueError(f"aud_profit_upper_bound: linprog failed {result.message}")
+    return -result.fun
+
+
+def self_check(ar_rrp, num_batteries=50, seed=0):
+    """Check BatteryFleet.run and simulate_batch give exactly the same results as simulate() for random batteries
+
+    Prices include NaN, inf and -inf (eg gaps in a csv) and some batteries start with a negative level.
+    Raises AssertionError if any battery differs.
+    """
+    rng = np.random.default_rng(seed)
+    ar_rrp = np.array(ar_rrp, dtype=np.float64)
+    ar_rrp[rng.choice(len(ar_rrp), size=min(len(ar_rrp), 12), replace=False)] = [np.nan, np.inf, -np.inf] * 4
+    dct_param = {'mwh_capacity': rng.uniform(50, 400, num_batteries), 'mw_limit': rng.uniform(25, 200, num_batteries),
+                 'efficiency': rng.uniform(0.8, 0.95, num_batteries)}
+    ar_rrp_break, ar_rrp_gap = rng.uniform(20, 100, num_batteries), rng.uniform(-20, 80, num_batteries)
+    ar_mwh_level = np.where(rng.random(num_batteries) < 0.2, -10.0, 0.0)
+    fleet = BatteryFleet(rrp_break=ar_rrp_break, rrp_gap=ar_rrp_gap, mwh_level=ar_mwh_level, **dct_param)
+    # Run in two parts to check levels and profits carry on
+    fleet.run(ar_rrp[:len(ar_rrp) // 2])
+    fleet.run(ar_rrp[len(ar_rrp) // 2:])
+    ar_aud_batch, ar_level_batch = simulate_batch(ar_rrp, ar_rrp_break, ar_rrp_gap, **dct_param)
+    for i in range(num_batteries):
+        dct_battery = {key: ar[i] for key, ar in dct_param.items()}
+        aud_profit, mwh_level, _ = simulate(ar_rrp, ar_rrp_break[i], ar_rrp_gap[i], mwh_level=ar_mwh_level[i],
+                                            **dct_battery)
+        # Compared as arrays so NaN == NaN, in case a battery sells at inf
+        np.testing.assert_array_equal([fleet.ar_aud_profit[i], fleet.ar_mwh_level[i]], [aud_profit, mwh_level],
+                                      err_msg=f"BatteryFleet battery {i}")
+        aud_profit, mwh_level, _ = simulate(ar_rrp, ar_rrp_break[i], ar_rrp_gap[i], **dct_battery)
+        np.testing.assert_array_equal([ar_aud_batch[i], ar_level_batch[i]], [aud_profit, mwh_level],
+                                      err_msg=f"simulate_batch candidate {i}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    # Same month of data as meetup092
+    url = "http://nemlog.com.au/api/unit/EMERASF1/20201101/20201130/csv"
+    filename = "unit_emerasf1_20201101_20201130.csv"
+    try:
+        df = pd.read_csv(filename, parse_dates=['SETTLEMENTDATE'], index_col='SETTLEMENTDATE')
+    except FileNotFoundError:
+        logger.info(f"File {filename} not found so retrieving from Internet")
+        df = pd.read_csv(url, parse_dates=['SETTLEMENTDATE'], index_col='SETTLEMENTDATE')
+        df.to_csv(filename)
+    ar_rrp = df['RRP'].to_numpy(dtype=np.float64)
+    self_check(ar_rrp)
+
+    result = opt.minimize(loss_function_for_rrp_break_and_gap, x0=np.array([60, 30]), args=(ar_rrp,),
+                          method='Nelder-Mead', options={'xatol': 0.1, 'fatol': 10})
+    logger.info(f"Optimisation result using minimize {result}")
+    result = opt.differential_evolution(loss_function_for_rrp_break_and_gap, bounds=[(20, 100), (-20, 80)],
+                                        args=(ar_rrp,))
+    logger.info(f"Optimisation result using differential_evolution {result}")
+    # Whole population of each generation is simulated in one pass over the prices
+    result = opt.differential_evolution(loss_function_vectorized, bounds=[(20, 100), (-20, 80)], args=(ar_rrp,),
+                                        vectorized=True, updating='deferred')
+    logger.info(f"Optimisation result using differential_evolution vectorized {result}")
+    # How much profit is the threshold strategy leaving on the table
+    aud_profit_optimal, mwh_level_optimal, _ = optimal_dispatch(ar_rrp, rrp_final=result.x[0])
+    logger.info(f"Threshold strategy ${-result.fun:12,.2f}, optimal dispatch ${aud_profit_optimal + mwh_level_optimal * result.x[0]:12,.2f}, upper bound ${aud_profit_upper_bound(ar_rrp, rrp_final=result.x[0]):12,.2f}")
+    df_plot = df_simulate(df, rrp_break=result.x[0], rrp_gap=result.x[1])
+    logger.info(f"df_plot.head()=\n{df_plot.head()}")
+    # A portfolio of 1000 batteries of different sizes and strategies trading over the same month
+    rng = np.random.default_rng(92)
+    fleet = BatteryFleet(mwh_capacity=rng.uniform(50, 400, 1000), mw_limit=rng.uniform(25, 200, 1000),
+                         efficiency=rng.uniform(0.8, 0.95, 1000), rrp_break=rng.uniform(20, 100, 1000),
+                         rrp_gap=rng.uniform(-20, 80, 1000))
+    ar_aud_fleet = fleet.run(ar_rrp)
+    logger.info(f"Fleet totals {fleet.dct_totals()}")
+    logger.info(f"Best batteries in fleet\n{fleet.df_assets().nlargest(5, 'aud_profit_incl_storage')}")
+    logger.info(f"Fleet profit by day\n{pd.Series(ar_aud_fleet, index=df.index).resample('D').sum().head()}")
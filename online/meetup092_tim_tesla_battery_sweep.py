@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""MeetUp 092 - Beginners Python and Machine Learning - Tesla SA Battery parameter sweep
+
+Companion to meetup092_tim_tesla_battery_optimisation.py and meetup092_tim_tesla_battery_simulator.py
+
+Grid search rrp_break x rrp_gap x battery size (mwh_capacity, mw_limit) across many months of prices using all
+the cores on your computer.
+- Price arrays are copied once into multiprocessing.shared_memory. Worker processes read them from there rather
+  than having them pickled and sent with every task
+- Each task is one month and one battery size. All the (rrp_break, rrp_gap) candidates for that task are
+  simulated together in a single pass over the prices using simulate_batch
+- Results are collected as each task finishes, with progress logged, into a tidy DataFrame (one row per
+  configuration)
+
+Usage:
+    import meetup092_tim_tesla_battery_sweep as sweep
+    df_results = sweep.sweep({'2020-11': ar_rrp_nov, '2020-12': ar_rrp_dec},
+                             ar_rrp_break=np.arange(20, 101, 5), ar_rrp_gap=np.arange(-20, 81, 5),
+                             lst_battery=[(129, 100), (194, 150)])
+
+Worker processes import this module so keep it free of code outside functions (other than the __main__ block)
+
+To install third party libraries
+
+pip install numpy pandas scipy
+"""
+
+# Standard libraries
+import concurrent.futures
+import datetime
+import logging
+import time
+from multiprocessing import shared_memory
+# Third party libraries
+import numpy as np
+import pandas as pd
+# Local modules
+import meetup092_tim_tesla_battery_data as data
+import meetup092_tim_tesla_battery_simulator as sim
+
+logger = logging.getLogger(__name__)
+
+# Price arrays in each worker process, set by worker_init. Views into shared memory, not copies
+dct_rrp_worker = {}
+shm_worker = None
+
+
+def worker_init(shm_name, dct_offset):
+    """Runs once in each worker process. Attach to shared memory and create a numpy view for each month"""
+    global shm_worker
+    shm_worker = shared_memory.SharedMemory(name=shm_name)
+    for label, (start, stop) in dct_offset.items():
+        dct_rrp_worker[label] = np.ndarray((stop - start,), dtype=np.float64, buffer=shm_worker.buf, offset=start * 8)
+
+
+def run_task(label, mwh_capacity, mw_limit, ar_rrp_break, ar_rrp_gap, efficiency):
+    """Simulate all (rrp_break, rrp_gap) candidates for one month and one battery size"""
+    ar_profit, ar_level = sim.simulate_batch(dct_rrp_worker[label], ar_rrp_break, ar_rrp_gap,
+                                             mwh_capacity=mwh_capacity, mw_limit=mw_limit, efficiency=efficiency)
+    return pd.DataFrame({
+        'month': label,
+        'mwh_capacity': mwh_capacity,
+        'mw_limit': mw_limit,
+        'rrp_break': ar_rrp_break,
+        'rrp_gap': ar_rrp_gap,
+        'aud_profit': ar_profit,
+        'mwh_level': ar_level,
+        'aud_profit_incl_storage': ar_profit + ar_level * ar_rrp_break,
+    })
+
+
+def sweep(dct_rrp, ar_rrp_break, ar_rrp_gap, lst_battery, efficiency=sim.EFFICIENCY, max_workers=None):
+    """Simulate every combination of month, battery size, rrp_break and rrp_gap in a process pool
+
+    :param dct_rrp: dict of label (eg '2020-11') to array of RRP for each interval in that month
+    :param ar_rrp_break: values of rrp_break to try
+    :param ar_rrp_gap: values of rrp_gap to try
+    :param lst_battery: list of (mwh_capacity, mw_limit) battery sizes to try
+    :param efficiency: Round trip efficiency of charging and discharging battery
+    :param max_workers: Number of processes. Default is number of cores
+    :return: DataFrame with one row per configuration
+    """
+    ar_break_grid, ar_gap_grid = np.meshgrid(np.asarray(ar_rrp_break, dtype=np.float64),
+                                             np.asarray(ar_rrp_gap, dtype=np.float64), indexing='ij')
+    ar_break_grid, ar_gap_grid = ar_break_grid.ravel(), ar_gap_grid.ravel()
+    # Publish all months once in a single shared memory block, remembering where each month starts and stops
+    dct_offset = {}
+    num_values = 0
+    for label, ar_rrp in dct_rrp.items():
+        dct_offset[label] = (num_values, num_values + len(ar_rrp))
+        num_values += len(ar_rrp)
+    shm = shared_memory.SharedMemory(create=True, size=max(num_values, 1) * 8)
+    try:
+        for label, (start, stop) in dct_offset.items():
+            np.ndarray((stop - start,), dtype=np.float64, buffer=shm.buf, offset=start * 8)[:] = dct_rrp[label]
+        lst_df = []
+        time_start = time.perf_counter()
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, initializer=worker_init,
+                                                    initargs=(shm.name, dct_offset)) as executor:
+            lst_future = [executor.submit(run_task, label, mwh_capacity, mw_limit, ar_break_grid, ar_gap_grid,
+                                          efficiency)
+                          for label in dct_rrp for mwh_capacity, mw_limit in lst_battery]
+            for num_done, future in enumerate(concurrent.futures.as_completed(lst_future), start=1):
+                lst_df.append(future.result())
+                logger.info(f"Sweep {num_done}/{len(lst_future)} tasks done, {num_done * len(ar_break_grid)} configurations in {time.perf_counter() - time_start:6.1f}s")
+    finally:
+        shm.close()
+        shm.unlink()
+    if not lst_df:
+        return pd.DataFrame(columns=['month', 'mwh_capacity', 'mw_limit', 'rrp_break', 'rrp_gap', 'aud_profit',
+                                     'mwh_level', 'aud_profit_incl_storage'])
+    df_sweep = pd.concat(lst_df, ignore_index=True)
+    return df_sweep.sort_values(['month', 'mwh_capacity', 'mw_limit', 'rrp_break', 'rrp_gap'], ignore_index=True)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    # Download (or memory-map from the binary cache) a few months of data for Emerald solar farm from nemlog.com.au
+    lst_url = data.lst_month_sources("EMERASF1", datetime.date(2020, 9, 1), datetime.date(2020, 12, 31), tf_url=True)
+    dct_rrp_month = {f"2020-{month:02d}": data.ar_cached(url, 'RRP') for month, url in zip(range(9, 13), lst_url)}
+
+    df_sweep = sweep(dct_rrp_month, ar_rrp_break=np.arange(20, 101, 5), ar_rrp_gap=np.arange(-20, 81, 5),
+                     lst_battery=[(129, 100), (194, 150), (258, 100)])
+    # Best configuration for each month and battery size
+    idx_best = df_sweep.groupby(['month', 'mwh_capacity', 'mw_limit'])['aud_profit_incl_storage'].idxmax()
+    print(df_sweep.loc[idx_best])
@@ -0,0 +1,231 @@
+#! /usr/bin/env python3
+r"""MeetUp 142 - Beginners' Python and Machine Learning - Wordle strategy benchmark
+
+Companion to meetup142_tim_wordle_with_wordlist.py, meetup142_tim_wordle_clue_matrix.py and
+meetup142_tim_wordle_solver.py
+
+The game loop in meetup142 asks a person for each guess with input(). This module plays every word in
+lst_answers without a person, asking a strategy for each guess instead, and reports how well the strategy did:
+- how many games took 1, 2, 3, 4, 5, 6 guesses, and how many weren't solved in 6 ('X')
+- failure rate and mean guesses for games solved
+- games per second
+
+A strategy is a function strategy(state) returning a guess, where state is a GameState with the clue matrix,
+the answers still possible (narrowed down after each guess like find_possible in meetup142), the guesses
+allowed and the patterns of guesses so far. Strategies must be functions defined at module level so they can be
+sent to worker processes. Games are split into chunks and played in a process pool.
+
+Results can be saved as a baseline json file. Later runs are compared with the baseline so a change to a
+solver can be judged on both quality (mean guesses and failures) and speed (games per second).
+
+Usage from command line:
+    python meetup142_tim_wordle_benchmark.py --strategy entropy --save-baseline baseline_entropy.json
+    python meetup142_tim_wordle_benchmark.py --strategy entropy --baseline baseline_entropy.json
+
+Usage from python:
+    import meetup142_tim_wordle_benchmark as wb
+    dct_result = wb.benchmark(wb.strategy_entropy, lst_answers, lst_guesses, hard_mode=True)
+
+@author D Tim Cummings
+"""
+import argparse
+import concurrent.futures
+import json
+import logging
+import random
+import time
+
+import numpy as np
+
+import meetup142_tim_wordle_clue_matrix as cm
+import meetup142_tim_wordle_solver as ws
+
+logger = logging.getLogger(__name__)
+
+MAX_GUESSES = 6
+# Answers per task sent to the pool
+CHUNK_GAMES = 50
+# Allowed worsening compared with baseline before reporting a regression
+TOLERANCE_MEAN_GUESSES = 0.01
+TOLERANCE_GAMES_PER_SECOND = 0.2
+
+# Clue matrix and solvers in each worker process, set by worker_init
+clue_matrix_worker = None
+dct_solver_worker = {}
+
+
+class GameState:
+    """What a strategy knows about the game being played"""
+
+    def __init__(self, clue_matrix, hard_mode=False):
+        self.clue_matrix = clue_matrix
+        self.hard_mode = hard_mode
+        self.ar_letters_all = cm.ar_letters(clue_matrix.lst_all_valid_guesses)
+        self.new_game()
+
+    def new_game(self):
+        # indexes of answers still possible, True for each valid guess allowed, and pattern for each guess so far
+        self.ar_idx_possible = np.arange(len(self.clue_matrix.lst_answers))
+        self.ar_allowed = np.ones(len(self.clue_matrix.lst_all_valid_guesses), dtype=bool)
+        self.dct_pattern_per_guess = {}
+
+    def update(self, guess, value):
+        self.dct_pattern_per_guess[guess] = value
+        self.ar_idx_possible = self.clue_matrix.find_possible({guess: value}, self.ar_idx_possible)
+        if self.hard_mode:
+            self.ar_allowed &= ws.ar_allowed_hard_mode(self.ar_letters_all, guess, value)
+
+
+def strategy_first_possible(state):
+    """Guess the first answer (alphabetically) still possible"""
+    return state.clue_matrix.lst_answers[state.ar_idx_possible[0]]
+
+
+def strategy_random_possible(state):
+    """Guess any answer still possible. Seeded from the guesses so far so results are repeatable"""
+    rng = random.Random(",".join(state.dct_pattern_per_guess))
+    return state.clue_matrix.lst_answers[rng.choice(state.ar_idx_possible.tolist())]
+
+
+def best_guess_from_solver(state, criterion):
+    """Best guess from a Solver (one per criterion and mode in each process) set to the state of the game"""
+    key = (criterion, state.hard_mode)
+    if key not in dct_solver_worker:
+        # Scoring in this process because games are already spread over the pool
+        dct_solver_worker[key] = ws.Solver(state.clue_matrix, hard_mode=state.hard_mode, criterion=criterion,
+                                           max_workers=0)
+    solver = dct_solver_worker[key]
+    solver.ar_idx_possible = state.ar_idx_possible
+    solver.ar_allowed = state.ar_allowed
+    solver.num_guesses = len(state.dct_pattern_per_guess)
+    return solver.best_guess()
+
+
+def strategy_entropy(state):
+    """Guess with the most expected information (see meetup142_tim_wordle_solver)"""
+    return best_guess_from_solver(state, 'entropy')
+
+
+def strategy_expected(state):
+    """Guess with the fewest expected answers left (see meetup142_tim_wordle_solver)"""
+    return best_guess_from_solver(state, 'expected')
+
+
+STRATEGIES = {
+    'first': strategy_first_possible,
+    'random': strategy_random_possible,
+    'entropy': strategy_entropy,
+    'expected': strategy_expected,
+}
+
+
+def play(answer, strategy, state, max_guesses=MAX_GUESSES):
+    """Play one game. Returns number of guesses to find answer or None if not found in max_guesses
+
+    Raises ValueError if the strategy makes a guess which isn't a word (or isn't allowed in hard mode)"""
+    state.new_game()
+    for num in range(1, max_guesses + 1):
+        guess = strategy(state)
+        idx_guess = state.clue_matrix.dct_idx_guess.get(guess)
+        if idx_guess is None:
+            raise ValueError(f"play: {strategy.__name__} guessed {guess} which is not a word")
+        if not state.ar_allowed[idx_guess]:
+            raise ValueError(f"play: {strategy.__name__} guessed {guess} which is not allowed in hard mode")
+        value = state.clue_matrix.pattern(answer, guess)
+        if value == cm.PATTERN_ALL_CORRECT:
+            return num
+        state.update(guess, value)
+    return None
+
+
+def worker_init(lst_answers, lst_guesses, dir_cache):
+    """Runs once in each worker process. Memory-map the clue matrix"""
+    global clue_matrix_worker
+    clue_matrix_worker = cm.ClueMatrix(lst_answers, lst_guesses, dir_cache)
+
+
+def play_chunk(lst_answer, strategy, hard_mode, max_guesses):
+    """Runs in worker process. Number of guesses (or None) for each answer"""
+    state = GameState(clue_matrix_worker, hard_mode)
+    return [play(answer, strategy, state, max_guesses) for answer in lst_answer]
+
+
+def benchmark(strategy, lst_answers, lst_guesses, hard_mode=False, max_guesses=MAX_GUESSES, dir_cache=cm.bundle_dir,
+              max_workers=None):
+    """Play every word in lst_answers using strategy in a process pool
+
+    :param strategy: function strategy(state) returning guess. Must be defined at module level
+    :param lst_answers: possible answers, all of which are played
+    :param lst_guesses: other valid guesses
+    :param hard_mode: True if guesses must use CORRECT and MOVE letters from earlier clues
+    :param max_guesses: Number of guesses before game is lost
+    :param dir_cache: Directory for clue matrix file
+    :param max_workers: Number of processes. Default is number of cores
+    :return: dict of results which can be saved as json
+    """
+    # Build (or check) the clue matrix file once before workers memory-map it
+    cm.ClueMatrix(lst_answers, lst_guesses, dir_cache)
+    lst_num = []
+    time_start = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, initializer=worker_init,
+                                                initargs=(lst_answers, lst_guesses, dir_cache)) as executor:
+        lst_future = [executor.submit(play_chunk, lst_answers[i:i + CHUNK_GAMES], strategy, hard_mode, max_guesses)
+                      for i in range(0, len(lst_answers), CHUNK_GAMES)]
+        for future in lst_future:
+            lst_num.extend(future.result())
+    seconds = time.perf_counter() - time_start
+    lst_solved = [num for num in lst_num if num is not None]
+    dct_distribution = {str(num): lst_solved.count(num) for num in range(1, max_guesses + 1)}
+    dct_distribution['X'] = len(lst_num) - len(lst_solved)
+    return {
+        'strategy': strategy.__name__,
+        'hard_mode': hard_mode,
+        'num_games': len(lst_num),
+        'distribution': dct_distribution,
+        'mean_guesses': sum(lst_solved) / len(lst_solved) if lst_solved else None,
+        'failure_rate': dct_distribution['X'] / len(lst_num) if lst_num else None,
+        'seconds': seconds,
+        'games_per_second': len(lst_num) / seconds,
+    }
+
+
+def lst_regressions(dct_result, dct_baseline):
+    """Reasons dct_result is worse than dct_baseline. Empty list if no regression"""
+    lst_reason = []
+    if dct_result['num_games'] != dct_baseline['num_games'] or dct_result['hard_mode'] != dct_baseline['hard_mode']:
+        lst_reason.append(f"not comparable with baseline {dct_baseline['num_games']} games hard_mode={dct_baseline['hard_mode']}")
+        return lst_reason
+    if dct_result['failure_rate'] > dct_baseline['failure_rate']:
+        lst_reason.append(f"failure rate {dct_result['failure_rate']:.4f} > baseline {dct_baseline['failure_rate']:.4f}")
+    if (dct_result['mean_guesses'] or 0) > (dct_baseline['mean_guesses'] or 0) + TOLERANCE_MEAN_GUESSES:
+        lst_reason.append(f"mean guesses {dct_result['mean_guesses']:.4f} > baseline {dct_baseline['mean_guesses']:.4f}")
+    if dct_result['games_per_second'] < dct_baseline['games_per_second'] * (1 - TOLERANCE_GAMES_PER_SECOND):
+        lst_reason.append(f"{dct_result['games_per_second']:.1f} games/s < baseline {dct_baseline['games_per_second']:.1f}")
+    return lst_reason
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MeetUp142 Wordle - play every answer with a strategy and report results")
+    parser.add_argument("-s", "--strategy", default="entropy", choices=list(STRATEGIES), help="guessing strategy")
+    parser.add_argument("--hard", action="store_true", help="play in hard mode")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="number of processes (default all cores)")
+    parser.add_argument("--baseline", help="json file of earlier results to compare with. Exit 1 if worse")
+    parser.add_argument("--save-baseline", help="json file to save results in")
+    parser.add_argument("-l", "--log", default="INFO", action="store", help="set log level. eg: --log INFO",
+                        type=str.upper, choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"])
+    args = parser.parse_args()
+    logging.basicConfig(level=getattr(logging, args.log))
+    lst_valid_answers, lst_valid_guesses = cm.fetch_word_lists()
+    dct_benchmark = benchmark(STRATEGIES[args.strategy], lst_valid_answers, lst_valid_guesses, hard_mode=args.hard,
+                              max_workers=args.workers)
+    print(json.dumps(dct_benchmark, indent=2))
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(dct_benchmark, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            lst_reason = lst_regressions(dct_benchmark, json.load(f))
+        for reason in lst_reason:
+            logger.error(f"Regression: {reason}")
+        if lst_reason:
+            raise SystemExit(1)
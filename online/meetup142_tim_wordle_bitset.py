@@ -0,0 +1,138 @@
+#! /usr/bin/env python3
+r"""MeetUp 142 - Beginners' Python and Machine Learning - Wordle bitset index
+
+Companion to meetup142_tim_wordle_with_wordlist.py and meetup142_tim_wordle_clue_matrix.py
+
+find_possible in meetup142 checks every remaining word against every guess with clues(word, guess). Instead, this
+index stores a set of words as a python int used as a bitset, where bit n is 1 if word n is in the set. Sets are
+precomputed for:
+- each (position, letter) eg words with 'a' as first letter
+- each (letter, count) for words with at least count of letter eg words with at least two 'e'
+
+The clues for a guess say which letters are (or aren't) at each position and how many of each letter the answer
+has (exactly that many if some of that letter is WRONG, otherwise at least that many). So the words matching a
+guess's clues are found with a handful of & and ~ operations on these ints, each of which works on 64 words at a
+time.
+
+In hard mode, letters shown CORRECT must be used in the same place and letters shown CORRECT or MOVE must be used
+at least as many times in later guesses. The words allowed are also a bitset so checking a guess is a single bit
+test.
+
+Usage:
+    import meetup142_tim_wordle_bitset as wbs
+    index = wbs.BitsetIndex(lst_answers + lst_guesses)
+    bits_possible = index.bits_find_possible({"raise": cm.pattern("brace", "raise")})
+    print(index.words(bits_possible))
+
+@author D Tim Cummings
+"""
+import logging
+import string
+
+import numpy as np
+
+import meetup142_tim_wordle_clue_matrix as cm
+
+logger = logging.getLogger(__name__)
+
+
+def bits_from_bool(ar_bool):
+    """Python int with bit n set if ar_bool[n] is True"""
+    return int.from_bytes(np.packbits(ar_bool, bitorder='little').tobytes(), 'little')
+
+
+class BitsetIndex:
+    """Bitsets of words for each (position, letter) and each (letter, minimum count)"""
+
+    def __init__(self, lst_words):
+        self.lst_words = list(lst_words)
+        self.dct_idx_word = {word: idx for idx, word in enumerate(self.lst_words)}
+        self.bits_all = (1 << len(self.lst_words)) - 1
+        ar_letters = cm.ar_letters(self.lst_words)
+        self.dct_bits_position = {}
+        self.dct_bits_at_least = {}
+        for letter in string.ascii_lowercase:
+            ar_is_letter = ar_letters == ord(letter)
+            for i in range(cm.NUM_LETTERS):
+                self.dct_bits_position[(i, letter)] = bits_from_bool(ar_is_letter[:, i])
+            ar_count = ar_is_letter.sum(axis=1)
+            self.dct_bits_at_least[(letter, 0)] = self.bits_all
+            for count in range(1, cm.NUM_LETTERS + 1):
+                self.dct_bits_at_least[(letter, count)] = bits_from_bool(ar_count >= count)
+            self.dct_bits_at_least[(letter, cm.NUM_LETTERS + 1)] = 0
+
+    def bits_for_clue(self, guess, value):
+        """Words which would give the same pattern value for guess if they were the answer"""
+        bits = self.bits_all
+        dct_count = {}
+        set_wrong = set()
+        lst_digit = cm.clues_from_pattern(value, cm.DIGIT_CORRECT, cm.DIGIT_MOVE, cm.DIGIT_WRONG)
+        for i, (letter, digit) in enumerate(zip(guess, lst_digit)):
+            if digit == cm.DIGIT_CORRECT:
+                bits &= self.dct_bits_position[(i, letter)]
+            else:
+                bits &= ~self.dct_bits_position[(i, letter)]
+            if digit == cm.DIGIT_WRONG:
+                set_wrong.add(letter)
+            else:
+                dct_count[letter] = dct_count.get(letter, 0) + 1
+        for letter in set(guess):
+            count = dct_count.get(letter, 0)
+            bits &= self.dct_bits_at_least[(letter, count)]
+            if letter in set_wrong:
+                # A WRONG letter means the answer has no more of that letter than shown CORRECT or MOVE
+                bits &= ~self.dct_bits_at_least[(letter, count + 1)]
+        return bits
+
+    def bits_hard_mode(self, guess, value):
+        """Words allowed as later guesses in hard mode after guess got pattern value"""
+        bits = self.bits_all
+        dct_count = {}
+        lst_digit = cm.clues_from_pattern(value, cm.DIGIT_CORRECT, cm.DIGIT_MOVE, cm.DIGIT_WRONG)
+        for i, (letter, digit) in enumerate(zip(guess, lst_digit)):
+            if digit == cm.DIGIT_CORRECT:
+                bits &= self.dct_bits_position[(i, letter)]
+            if digit != cm.DIGIT_WRONG:
+                dct_count[letter] = dct_count.get(letter, 0) + 1
+        for letter, count in dct_count.items():
+            bits &= self.dct_bits_at_least[(letter, count)]
+        return bits
+
+    def bits_find_possible(self, dct_pattern_per_guess, bits_possible_prev=None):
+        """Words matching all patterns so far. Each guess narrows down the words left by the previous guess"""
+        bits = self.bits_all if bits_possible_prev is None else bits_possible_prev
+        for guess, value in dct_pattern_per_guess.items():
+            bits &= self.bits_for_clue(guess, value)
+        return bits
+
+    def is_allowed(self, word, bits_allowed):
+        """True if word is one of the words in bits_allowed eg from bits_hard_mode"""
+        idx = self.dct_idx_word.get(word)
+        return idx is not None and bits_allowed >> idx & 1 == 1
+
+    def ar_idx(self, bits):
+        """numpy array of indexes of words in bits"""
+        num_bytes = (len(self.lst_words) + 7) // 8
+        ar_bool = np.unpackbits(np.frombuffer(bits.to_bytes(num_bytes, 'little'), dtype=np.uint8), bitorder='little')
+        return np.flatnonzero(ar_bool[:len(self.lst_words)])
+
+    def words(self, bits):
+        """Words in bits"""
+        return [self.lst_words[idx] for idx in self.ar_idx(bits).tolist()]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    lst_valid_answers, lst_valid_guesses = cm.fetch_word_lists()
+    index_answers = BitsetIndex(lst_valid_answers)
+    index_guesses = BitsetIndex(lst_valid_answers + lst_valid_guesses)
+    the_answer = "brace"
+    bits_possible = None
+    bits_allowed = index_guesses.bits_all
+    for the_guess in ["raise", "cloth", "grace", "brace"]:
+        print(f"{the_guess} allowed in hard mode {index_guesses.is_allowed(the_guess, bits_allowed)}")
+        the_pattern = cm.pattern(the_answer, the_guess)
+        bits_possible = index_answers.bits_find_possible({the_guess: the_pattern}, bits_possible)
+        bits_allowed &= index_guesses.bits_hard_mode(the_guess, the_pattern)
+        print(f"{the_guess} {''.join(cm.clues_from_pattern(the_pattern, 'C', 'M', '.'))} "
+              f"{bin(bits_possible).count('1')} {index_answers.words(bits_possible)[:30]}")
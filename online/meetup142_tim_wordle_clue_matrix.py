@@ -0,0 +1,229 @@
+#! /usr/bin/env python3
+r"""MeetUp 142 - Beginners' Python and Machine Learning - Wordle clue matrix
+
+Companion to meetup142_tim_wordle_with_wordlist.py, meetup144_tim_wordle_tkinter.py and
+meetup146_tim_wordle_tkinter_pyinstaller.py
+
+clues(answer, guess) from meetup137 builds a list of colour codes, one for each letter. find_possible calls it for
+every remaining word for every guess, so each turn works out thousands of clues from scratch.
+
+This module works out the clue for every (answer, valid guess) pair once and stores them in a numpy matrix.
+Each clue is encoded as a single number 0 to 242 (uint8) by treating the five letter clues as a base 3 number
+(WRONG = 0, MOVE = 1, CORRECT = 2, first letter is most significant digit). eg CORRECT WRONG MOVE WRONG WRONG is
+2*81 + 0*27 + 1*9 + 0*3 + 0*1 = 171 and all CORRECT is 242.
+
+The matrix is built with numpy comparisons of all guesses against a chunk of answers at a time (a second or two),
+saved with np.save and memory-mapped when loaded again, so startup doesn't have to read the whole file. Finding
+which answers are still possible after a guess is then a single array comparison of one column of the matrix.
+
+Usage:
+    import meetup142_tim_wordle_clue_matrix as cm
+    lst_answers, lst_guesses = cm.fetch_word_lists()
+    clue_matrix = cm.ClueMatrix(lst_answers, lst_guesses)
+    ar_idx_possible = clue_matrix.find_possible({"raise": cm.pattern("brace", "raise")})
+    print(clue_matrix.answers(ar_idx_possible))
+
+To install third party libraries (beautifulsoup4 and lxml only needed to fetch word lists from the web)
+
+pip install numpy beautifulsoup4 lxml
+
+@author D Tim Cummings
+"""
+import hashlib
+import json
+import logging
+import pathlib
+import re
+from urllib.request import urlopen
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Define constants (see meetup137 and meetup142)
+URL = "https://nytimes.com/games/wordle/index.html"
+bundle_dir = pathlib.Path(__file__).parent
+FIVE_LETTER_ANSWERS = "five_letter_answers.txt"
+FIVE_LETTER_GUESSES = "five_letter_guesses.txt"
+
+# Base 3 digit for each letter's clue
+DIGIT_WRONG = 0
+DIGIT_MOVE = 1
+DIGIT_CORRECT = 2
+NUM_LETTERS = 5
+NUM_PATTERNS = 3 ** NUM_LETTERS
+PATTERN_ALL_CORRECT = NUM_PATTERNS - 1
+# Value of each digit, first letter most significant
+AR_PLACE = 3 ** np.arange(NUM_LETTERS - 1, -1, -1)
+
+# Number of answers compared with all guesses at once when building matrix. Limits memory used
+CHUNK_ANSWERS = 256
+
+
+def fetch_word_lists(dir_cache=bundle_dir):
+    """From meetup142 fetch word lists from javascript of real wordle game and cache locally in dir_cache"""
+    path_answers = pathlib.Path(dir_cache) / FIVE_LETTER_ANSWERS
+    path_guesses = pathlib.Path(dir_cache) / FIVE_LETTER_GUESSES
+    try:
+        with open(path_answers) as f:
+            lst_answers = [w.strip() for w in f]
+        with open(path_guesses) as f:
+            lst_guesses = [w.strip() for w in f]
+        logger.info(f"read answers and guesses from files in {dir_cache}")
+    except FileNotFoundError:
+        # Only needed when the files aren't cached yet
+        from bs4 import BeautifulSoup
+        logger.info(f"fetch answers and guesses from web {URL}")
+        with urlopen(URL) as page:
+            soup = BeautifulSoup(page, features="lxml")
+        script = soup.find("script", src=True, defer=False)
+        url_js = URL[:URL.rfind("/") + 1] + script["src"]
+        with urlopen(url_js) as js_response:
+            str_js = js_response.read().decode(js_response.headers.get_content_charset())
+        ptn = re.compile(r"""(\[[a-z,"'\s]{5000,}])""")
+        lst_match = ptn.findall(str_js)
+        lst_answers = sorted(json.loads(lst_match[0]))
+        lst_guesses = sorted(json.loads(lst_match[1]))
+        for path, lst in [(path_answers, lst_answers), (path_guesses, lst_guesses)]:
+            with open(path, "w") as f:
+                for w in lst:
+                    f.write(w + "\n")
+    return lst_answers, lst_guesses
+
+
+def pattern(answer, guess):
+    """Same clues as clues(answer, guess) from meetup137 but encoded as a single base 3 number 0 to 242"""
+    lst_answer = list(answer)
+    lst_digit = [None] * len(answer)
+    for i, letter in enumerate(guess):
+        # First pass is to look for exact matches
+        if letter == answer[i]:
+            lst_digit[i] = DIGIT_CORRECT
+            lst_answer[i] = None
+    for i, letter in enumerate(guess):
+        # Second pass for partial matches, removing each match from answer so it doesn't trigger twice
+        if lst_digit[i] is None:
+            if letter in lst_answer:
+                lst_digit[i] = DIGIT_MOVE
+                lst_answer.remove(letter)
+            else:
+                lst_digit[i] = DIGIT_WRONG
+    value = 0
+    for digit in lst_digit:
+        value = value * 3 + digit
+    return value
+
+
+def pattern_from_clues(lst_clue, correct, move):
+    """Encode a list of clues from clues(answer, guess) using the CORRECT and MOVE constants of that script"""
+    value = 0
+    for clue in lst_clue:
+        value = value * 3 + (DIGIT_CORRECT if clue == correct else DIGIT_MOVE if clue == move else DIGIT_WRONG)
+    return value
+
+
+def clues_from_pattern(value, correct, move, wrong):
+    """List of clues like clues(answer, guess) from an encoded pattern using the constants of the calling script"""
+    lst_clue = []
+    for place in AR_PLACE.tolist():
+        digit = value // place % 3
+        lst_clue.append(correct if digit == DIGIT_CORRECT else move if digit == DIGIT_MOVE else wrong)
+    return lst_clue
+
+
+def ar_letters(lst_words):
+    """2D uint8 array of letters with one row per word"""
+    return np.frombuffer("".join(lst_words).encode("ascii"), dtype=np.uint8).reshape(len(lst_words), NUM_LETTERS)
+
+
+def ar_pattern_matrix(lst_answers, lst_guesses):
+    """Matrix of patterns (uint8) with one row for each answer and one column for each guess
+
+    Same rules as clues(answer, guess). A letter not in the right place is MOVE if the answer has more of that
+    letter (not counting exact matches) than there are earlier MOVE/WRONG letters the same in the guess"""
+    ar_answer = ar_letters(lst_answers)
+    ar_guess = ar_letters(lst_guesses)
+    ar_matrix = np.empty((len(lst_answers), len(lst_guesses)), dtype=np.uint8)
+    for start in range(0, len(lst_answers), CHUNK_ANSWERS):
+        # Each array below has shape (answers in chunk, guesses) and all letters are done one at a time
+        ar_answer_chunk = ar_answer[start:start + CHUNK_ANSWERS, np.newaxis, :]
+        lst_correct = [ar_answer_chunk[:, :, i] == ar_guess[:, i] for i in range(NUM_LETTERS)]
+        lst_not_correct = [~ar_correct for ar_correct in lst_correct]
+        ar_value = np.zeros((len(ar_answer_chunk), len(lst_guesses)), dtype=np.uint8)
+        for i in range(NUM_LETTERS):
+            # Answer letters, not exactly matched, equal to this guess letter
+            ar_available = np.zeros(ar_value.shape, dtype=np.uint8)
+            for j in range(NUM_LETTERS):
+                if j != i:
+                    ar_available += (ar_answer_chunk[:, :, j] == ar_guess[:, i]) & lst_not_correct[j]
+            # Earlier guess letters, not exactly matched, equal to this guess letter
+            ar_used = np.zeros(ar_value.shape, dtype=np.uint8)
+            for k in range(i):
+                ar_used += (ar_guess[:, k] == ar_guess[:, i]) & lst_not_correct[k]
+            ar_move = lst_not_correct[i] & (ar_used < ar_available)
+            ar_value *= 3
+            ar_value += lst_correct[i] * np.uint8(DIGIT_CORRECT) + ar_move * np.uint8(DIGIT_MOVE)
+        ar_matrix[start:start + CHUNK_ANSWERS] = ar_value
+    return ar_matrix
+
+
+class ClueMatrix:
+    """
+    Patterns for every answer (rows) and every valid guess (columns), built once and cached as a .npy file.
+
+    Valid guesses are lst_answers + lst_guesses in that order, like lst_all_valid_guesses in meetup142, so the
+    first len(lst_answers) columns are the answers. The file name includes a hash of the word lists so a new
+    word list builds a new matrix.
+    """
+
+    def __init__(self, lst_answers, lst_guesses, dir_cache=bundle_dir):
+        self.lst_answers = list(lst_answers)
+        self.lst_all_valid_guesses = self.lst_answers + list(lst_guesses)
+        # A word in both lists maps to its later column in dct_idx_guess, so rows have their own dict
+        self.dct_idx_guess = {word: idx for idx, word in enumerate(self.lst_all_valid_guesses)}
+        self.dct_idx_answer = {word: idx for idx, word in enumerate(self.lst_answers)}
+        str_hash = hashlib.sha1("\n".join(self.lst_all_valid_guesses + [str(len(self.lst_answers))]).encode()).hexdigest()
+        self.path = pathlib.Path(dir_cache) / f"wordle_clue_matrix_{str_hash[:12]}.npy"
+        try:
+            self.ar_pattern = np.load(self.path, mmap_mode='r')
+            logger.info(f"memory-mapped clue matrix {self.path}")
+        except FileNotFoundError:
+            logger.info(f"building clue matrix {len(self.lst_answers)} x {len(self.lst_all_valid_guesses)}")
+            self.ar_pattern = ar_pattern_matrix(self.lst_answers, self.lst_all_valid_guesses)
+            np.save(self.path, self.ar_pattern)
+
+    def pattern(self, answer, guess):
+        """Pattern from matrix for answer (from lst_answers) and guess (from lst_all_valid_guesses)"""
+        return int(self.ar_pattern[self.dct_idx_answer[answer], self.dct_idx_guess[guess]])
+
+    def find_possible(self, dct_pattern_per_guess, ar_idx_possible=None):
+        """Indexes of answers matching all patterns so far (for easy mode)
+
+        :param dct_pattern_per_guess: dict of guess to the pattern it got
+        :param ar_idx_possible: indexes of answers still possible before these guesses (default all answers)
+        :return: numpy array of indexes into lst_answers
+        """
+        if ar_idx_possible is None:
+            ar_idx_possible = np.arange(len(self.lst_answers))
+        for guess, value in dct_pattern_per_guess.items():
+            # Each guess narrows down the answers left by the previous guess
+            ar_idx_possible = ar_idx_possible[self.ar_pattern[ar_idx_possible, self.dct_idx_guess[guess]] == value]
+        return ar_idx_possible
+
+    def answers(self, ar_idx):
+        """Words in lst_answers for indexes"""
+        return [self.lst_answers[idx] for idx in ar_idx.tolist()]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    lst_valid_answers, lst_valid_guesses = fetch_word_lists()
+    clue_matrix = ClueMatrix(lst_valid_answers, lst_valid_guesses)
+    print(f"{clue_matrix.ar_pattern.shape=} {clue_matrix.ar_pattern.dtype=} {clue_matrix.path}")
+    the_answer = "brace"
+    dct_pattern = {}
+    ar_idx = None
+    for the_guess in ["raise", "cloth", "grace"]:
+        dct_pattern[the_guess] = clue_matrix.pattern(the_answer, the_guess)
+        ar_idx = clue_matrix.find_possible({the_guess: dct_pattern[the_guess]}, ar_idx)
+        print(f"{the_guess} {clues_from_pattern(dct_pattern[the_guess], 'C', 'M', '.')} {len(ar_idx)} {clue_matrix.answers(ar_idx)[:30]}")
@@ -0,0 +1,216 @@
+#! /usr/bin/env python3
+r"""MeetUp 142 - Beginners' Python and Machine Learning - Wordle solver
+
+Companion to meetup142_tim_wordle_with_wordlist.py and meetup142_tim_wordle_clue_matrix.py
+
+find_possible in meetup142 tells the player how many words are left but not which word to guess next. This
+solver scores every valid guess against the answers still possible and suggests the best one.
+
+For each guess, the answers still possible are split into groups by the clue pattern they would give (a
+histogram of up to 243 patterns from one column of the clue matrix). A good guess splits them into many small
+groups. Two ways of scoring are provided:
+- 'entropy': expected information in bits, sum of -p * log2(p) over the groups (maximise)
+- 'expected': expected number of answers left after the guess, sum of n * n / total (minimise)
+
+Histograms for thousands of guesses are calculated at once with np.bincount. While lots of answers are still
+possible (eg the first guess) the guesses are split into chunks and scored in a process pool, each worker
+memory-mapping the same clue matrix file.
+
+In hard mode any letter shown as CORRECT must be used in the same place and any letter shown as MOVE must be
+used somewhere in later guesses, so only guesses following those rules are scored.
+
+Usage:
+    import meetup142_tim_wordle_clue_matrix as cm
+    import meetup142_tim_wordle_solver as ws
+    clue_matrix = cm.ClueMatrix(*cm.fetch_word_lists())
+    with ws.Solver(clue_matrix, hard_mode=True) as solver:
+        the_guess = solver.best_guess()
+        solver.update(the_guess, cm.pattern(the_answer, the_guess))
+
+@author D Tim Cummings
+"""
+import concurrent.futures
+import logging
+import random
+import time
+
+import numpy as np
+
+import meetup142_tim_wordle_clue_matrix as cm
+
+logger = logging.getLogger(__name__)
+
+CRITERIA = ['entropy', 'expected']
+# Score in the main process if (answers possible) x (guesses to score) is less than this, otherwise use the pool
+MIN_CELLS_PARALLEL = 2_000_000
+# Guesses per task sent to the pool
+CHUNK_GUESSES = 1024
+
+# Clue matrix in each worker process, set by worker_init. Memory-mapped, not copied
+ar_pattern_worker = None
+
+
+def worker_init(path):
+    """Runs once in each worker process. Memory-map the clue matrix saved by ClueMatrix"""
+    global ar_pattern_worker
+    ar_pattern_worker = np.load(path, mmap_mode='r')
+
+
+def ar_scores(ar_pattern, ar_idx_possible, ar_idx_guess, criterion='entropy'):
+    """Score for each guess in ar_idx_guess given answers ar_idx_possible are still possible. Higher is better
+
+    :param ar_pattern: clue matrix, one row per answer and one column per valid guess
+    :param ar_idx_possible: indexes (rows) of answers still possible
+    :param ar_idx_guess: indexes (columns) of guesses to score
+    :param criterion: 'entropy' (bits of information) or 'expected' (negative of expected answers left)
+    :return: numpy array of float64 scores, one per guess
+    """
+    num_possible = len(ar_idx_possible)
+    ar_sub = ar_pattern[ar_idx_possible[:, np.newaxis], ar_idx_guess]
+    # Give each guess its own range of 243 bins so one bincount does every histogram
+    ar_bin = ar_sub + (np.arange(len(ar_idx_guess), dtype=np.int32) * cm.NUM_PATTERNS)
+    ar_count = np.bincount(ar_bin.ravel(), minlength=len(ar_idx_guess) * cm.NUM_PATTERNS)
+    ar_count = ar_count.reshape(len(ar_idx_guess), cm.NUM_PATTERNS).astype(np.float64)
+    if criterion == 'entropy':
+        # log2(n) is 0 for empty groups as well as groups of 1 so empty groups add nothing
+        return np.log2(num_possible) - (ar_count * np.log2(np.maximum(ar_count, 1))).sum(axis=1) / num_possible
+    if criterion == 'expected':
+        return -(ar_count * ar_count).sum(axis=1) / num_possible
+    raise ValueError(f"ar_scores: criterion must be one of {CRITERIA} not {criterion}")
+
+
+def score_chunk(ar_idx_possible, ar_idx_guess, criterion):
+    """Runs in worker process"""
+    return ar_scores(ar_pattern_worker, ar_idx_possible, ar_idx_guess, criterion)
+
+
+def ar_allowed_hard_mode(ar_letters_all, guess, value):
+    """True for each word allowed in hard mode after guess got pattern value
+
+    Letters shown CORRECT must be in the same place. Letters shown CORRECT or MOVE must be used at least as many
+    times as they were shown"""
+    ar_allowed = np.ones(len(ar_letters_all), dtype=bool)
+    lst_clue = cm.clues_from_pattern(value, cm.DIGIT_CORRECT, cm.DIGIT_MOVE, cm.DIGIT_WRONG)
+    dct_count = {}
+    for i, (letter, digit) in enumerate(zip(guess, lst_clue)):
+        if digit == cm.DIGIT_CORRECT:
+            ar_allowed &= ar_letters_all[:, i] == ord(letter)
+        if digit != cm.DIGIT_WRONG:
+            dct_count[letter] = dct_count.get(letter, 0) + 1
+    for letter, count in dct_count.items():
+        ar_allowed &= (ar_letters_all == ord(letter)).sum(axis=1) >= count
+    return ar_allowed
+
+
+class Solver:
+    """
+    Suggests guesses for one game at a time. Call update() with each guess and the pattern it got.
+
+    Scores for the first guess don't depend on the answer so they are only calculated once per Solver.
+    The process pool is started when first needed. Use Solver in a with statement (or call close()) to shut it
+    down.
+    """
+
+    def __init__(self, clue_matrix, hard_mode=False, criterion='entropy', max_workers=None):
+        """
+        :param clue_matrix: ClueMatrix from meetup142_tim_wordle_clue_matrix
+        :param hard_mode: True if guesses must use CORRECT and MOVE letters from earlier clues
+        :param criterion: 'entropy' or 'expected'
+        :param max_workers: Number of processes. Default is number of cores. 0 to score in this process only
+        """
+        if criterion not in CRITERIA:
+            raise ValueError(f"Solver: criterion must be one of {CRITERIA} not {criterion}")
+        self.clue_matrix = clue_matrix
+        self.hard_mode = hard_mode
+        self.criterion = criterion
+        self.max_workers = max_workers
+        self.executor = None
+        self.ar_letters_all = cm.ar_letters(clue_matrix.lst_all_valid_guesses)
+        self.ar_score_first = None
+        self.new_game()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def new_game(self):
+        """Start again with every answer possible and every guess allowed"""
+        self.ar_idx_possible = np.arange(len(self.clue_matrix.lst_answers))
+        self.ar_allowed = np.ones(len(self.clue_matrix.lst_all_valid_guesses), dtype=bool)
+        self.num_guesses = 0
+
+    def update(self, guess, value):
+        """Narrow down the answers still possible (and guesses allowed in hard mode) after guess got pattern value"""
+        self.ar_idx_possible = self.clue_matrix.find_possible({guess: value}, self.ar_idx_possible)
+        if self.hard_mode:
+            self.ar_allowed &= ar_allowed_hard_mode(self.ar_letters_all, guess, value)
+        self.num_guesses += 1
+
+    def possible(self):
+        """Answers still possible"""
+        return self.clue_matrix.answers(self.ar_idx_possible)
+
+    def ar_scores(self, ar_idx_guess):
+        """Scores for guesses, using the process pool if there is a lot to do"""
+        if self.max_workers == 0 or len(self.ar_idx_possible) * len(ar_idx_guess) < MIN_CELLS_PARALLEL:
+            return ar_scores(self.clue_matrix.ar_pattern, self.ar_idx_possible, ar_idx_guess, self.criterion)
+        if self.executor is None:
+            self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.max_workers,
+                                                                   initializer=worker_init,
+                                                                   initargs=(str(self.clue_matrix.path),))
+        lst_future = [self.executor.submit(score_chunk, self.ar_idx_possible, ar_idx_guess[i:i + CHUNK_GUESSES],
+                                           self.criterion)
+                      for i in range(0, len(ar_idx_guess), CHUNK_GUESSES)]
+        return np.concatenate([future.result() for future in lst_future])
+
+    def lst_ranked(self, num=10):
+        """Best num guesses as list of (guess, score). Guesses which could be the answer win ties
+
+        Raises ValueError if no answers match the clues so far (eg a clue entered wrongly)
+        """
+        if len(self.ar_idx_possible) == 0:
+            raise ValueError("Solver: no answers match the clues so far")
+        if len(self.ar_idx_possible) <= 2:
+            # Guessing one of the answers left can't do worse than any other guess
+            ar_idx_guess = self.ar_idx_possible
+        else:
+            ar_idx_guess = np.flatnonzero(self.ar_allowed)
+        if self.num_guesses > 0:
+            ar_score = self.ar_scores(ar_idx_guess)
+        else:
+            if self.ar_score_first is None:
+                self.ar_score_first = self.ar_scores(ar_idx_guess)
+            ar_score = self.ar_score_first
+        # Answers are the first columns of the clue matrix so their guess index is the same as their answer index
+        ar_is_possible = np.isin(ar_idx_guess, self.ar_idx_possible)
+        ar_order = np.lexsort((~ar_is_possible, -ar_score))[:num]
+        return [(self.clue_matrix.lst_all_valid_guesses[ar_idx_guess[i]], float(ar_score[i])) for i in ar_order]
+
+    def best_guess(self):
+        """Guess with the best score. Raises ValueError if no answers match the clues so far"""
+        return self.lst_ranked(1)[0][0]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    clue_matrix_main = cm.ClueMatrix(*cm.fetch_word_lists())
+    for tf_hard_mode in [False, True]:
+        with Solver(clue_matrix_main, hard_mode=tf_hard_mode) as solver:
+            the_answer = random.choice(clue_matrix_main.lst_answers)
+            print(f"\n{tf_hard_mode=} {the_answer=}")
+            the_guess = None
+            while the_guess != the_answer:
+                time_start = time.perf_counter()
+                lst_best = solver.lst_ranked(5)
+                the_guess = lst_best[0][0]
+                the_pattern = cm.pattern(the_answer, the_guess)
+                print(f"{the_guess} {''.join(cm.clues_from_pattern(the_pattern, 'C', 'M', '.'))} "
+                      f"{time.perf_counter() - time_start:6.3f}s best {lst_best} from {len(solver.ar_idx_possible)} possible")
+                solver.update(the_guess, the_pattern)
@@ -196,7 +196,8 @@ def find_possible(dct_clue_per_guess, lst_possible_prev):
     # for easy mode
     possible = lst_possible_prev
     for guess, lst_clue in dct_clue_per_guess.items():
-        possible = [word for word in lst_possible_prev if clues(word, guess) == lst_clue]
+        # Each guess narrows down the words left by the previous guess (not restarting from lst_possible_prev)
+        possible = [word for word in possible if clues(word, guess) == lst_clue]
     return possible
 
 
@@ -37,10 +37,13 @@ conda activate venv-bpaml144                    # Anaconda
 bpaml144\Scripts\activate.bat                   # Windows command prompt
 bpaml144\Scripts\Activate.ps1                   # Windows powershell
 """
+import bisect
+import concurrent.futures
 import json
 import logging
 import random
 import re
+import threading
 import tkinter.font
 from urllib.request import urlopen
 from bs4 import BeautifulSoup
@@ -254,6 +257,66 @@ def fetch_word_lists():
     return lst_answers, lst_guesses
 
 
+class SortedWords:
+    """Sorted list of words where `word in words` uses a binary search (bisect) rather than checking every word"""
+
+    def __init__(self, iterable):
+        self.lst_words = sorted(iterable)
+
+    def __contains__(self, word):
+        idx = bisect.bisect_left(self.lst_words, word)
+        return idx < len(self.lst_words) and self.lst_words[idx] == word
+
+    def __iter__(self):
+        return iter(self.lst_words)
+
+    def __len__(self):
+        return len(self.lst_words)
+
+    def __getitem__(self, item):
+        return self.lst_words[item]
+
+
+# fetch_word_lists can take seconds the first time (two downloads and parsing megabytes of javascript) so it runs
+# in a background thread while the window is shown. tkinter must only be used from the main thread, so the main
+# thread checks every POLL_MS milliseconds using root.after() whether the word lists have arrived.
+POLL_MS = 50
+
+
+def start_loading_word_lists():
+    """Fetch word lists in a background thread and start checking for when they have been loaded"""
+    future = concurrent.futures.Future()
+
+    def load():
+        try:
+            future.set_result(fetch_word_lists())
+        except Exception as e:
+            future.set_exception(e)
+
+    # daemon so closing the window while loading ends the program without waiting for the download
+    threading.Thread(target=load, daemon=True).start()
+    root.after(POLL_MS, check_word_lists_loaded, future)
+
+
+def check_word_lists_loaded(future):
+    """Runs in main thread (tkinter mainloop). Start game when word lists have been loaded"""
+    global lst_all_valid_guesses, lst_possible, the_answer
+    if not future.done():
+        root.after(POLL_MS, check_word_lists_loaded, future)
+        return
+    try:
+        lst_valid_answers, lst_valid_guesses = future.result()
+    except Exception as e:
+        logger.error(f"Could not load word lists {e}")
+        lbl_status['text'] = f"Could not load word lists: {e}"
+        return
+    lst_all_valid_guesses = SortedWords(lst_valid_answers + lst_valid_guesses)
+    the_answer = random.choice(lst_valid_answers)
+    lst_possible = lst_all_valid_guesses  # easy mode
+    lbl_status.grid_remove()
+    logger.debug(f"Loaded {len(lst_valid_answers)} answers and {len(lst_all_valid_guesses)} valid guesses")
+
+
 def clues(answer, guess):
     """From meetup137 return clues for current guess for given answer finding exact and partial matches"""
     # convert str to list of letters
@@ -282,7 +345,8 @@ def find_possible(dct_clue_per_guess, lst_possible_prev):
     """From meetup142 - for easy mode - find limited possibilities given all clues so far"""
     possible = lst_possible_prev
     for guess, lst_clue in dct_clue_per_guess.items():
-        possible = [word for word in lst_possible_prev if clues(word, guess) == lst_clue]
+        # Each guess narrows down the words left by the previous guess (not restarting from lst_possible_prev)
+        possible = [word for word in possible if clues(word, guess) == lst_clue]
     return possible
 
 
@@ -304,6 +368,9 @@ def create_letters():
 
     def handle_keypress(event):
         """Nested function so dct_labels is in scope of this event handler"""
+        if lst_all_valid_guesses is None and event.keysym in ['Return', 'KP_Enter']:
+            # Can't check guess until word lists have been loaded
+            return
         handle_keypress_for_letters(event, dct_labels)
 
     root.bind("<Key>", handle_keypress)
@@ -355,10 +422,13 @@ if __name__ == "__main__":
     # create_letters()
     current_guess = 0
     current_letter = 0
-    lst_valid_answers, lst_valid_guesses = fetch_word_lists()
-    lst_all_valid_guesses = lst_valid_answers + lst_valid_guesses
-    the_answer = random.choice(lst_valid_answers)
     dct_clue = {}  # easy mode
-    lst_possible = lst_all_valid_guesses  # easy mode
+    # Set by check_word_lists_loaded. Until then, show a message and ignore Enter key
+    lst_all_valid_guesses = None
+    lst_possible = None
+    the_answer = None
+    lbl_status = ttk.Label(master=root, text="Loading word lists...", anchor="center")
+    lbl_status.grid(row=7, column=0, columnspan=5, sticky="nsew")
+    start_loading_word_lists()
 
     tk.mainloop()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""MeetUp 173 - Beginners' Python and Machine Learning - time series measurement store in sqlite3
+
+Companion to meetup173_tim_relational_database.py and meetup204_tim_bulk_load.py
+
+tbl_measure in meetup173 is a rowid table with dt_measure stored as text ('2024-01-01 00:05:00') and read back with
+PARSE_DECLTYPES, which calls a converter on every value read. Rows are stored in the order they were inserted, so
+"one sensor over a date range" has to look through the rows of every sensor in that range (or the whole table).
+
+MeasureStore keeps the same measurements in a layout suited to time series:
+- WITHOUT ROWID table with PRIMARY KEY (id_sensor, ts_measure) so the rows are stored clustered in that order and
+  one sensor's measurements over a date range are next to each other in the file
+- ts_measure is an integer (seconds since 1970-01-01, times taken as UTC) which is smaller than text, compares
+  faster and needs no converter
+- WAL journal mode with synchronous=NORMAL so commits don't wait for the disk twice and readers don't block the
+  writer, plus larger page size and page cache
+- Rows are inserted in batches sorted by primary key so each batch appends to a few places in the b-tree
+Measurements already stored (same sensor and time) are ignored, so the same data can be loaded again.
+
+The benchmark loads the same synthetic measurements into meetup173's schema (with its unique index) and into
+MeasureStore, and times ingest and "one sensor over one day" queries.
+
+Usage:
+    import meetup173_tim_measure_store as measure_store
+    with measure_store.MeasureStore("bpaml173_ts.db") as store:
+        store.insert(bulk_load.measure_rows(lst_data_raw))
+        lst_row = store.range_rows("E1843", datetime.datetime(2024, 6, 1), datetime.datetime(2024, 6, 2))
+
+Usage from command line:
+    python meetup173_tim_measure_store.py --rows 1000000 --queries 200
+"""
+
+# Standard libraries
+import argparse
+import datetime
+import logging
+import os
+import random
+import sqlite3
+import statistics
+import time
+# Local modules
+import meetup204_tim_bulk_load as bulk_load
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 8192
+# Negative cache_size is in KiB rather than pages
+CACHE_KIB = 65536
+MMAP_SIZE = 256 * 1024 * 1024
+
+SQL_CREATE = """
+CREATE TABLE IF NOT EXISTS tbl_measure_ts (
+    id_sensor      TEXT    NOT NULL,
+    ts_measure     INTEGER NOT NULL,
+    rl_measurement REAL,
+    PRIMARY KEY (id_sensor, ts_measure)) WITHOUT ROWID;
+"""
+SQL_INSERT = "INSERT OR IGNORE INTO tbl_measure_ts (id_sensor, ts_measure, rl_measurement) VALUES (?, ?, ?)"
+SQL_RANGE = """
+SELECT ts_measure, rl_measurement FROM tbl_measure_ts
+WHERE id_sensor = ? AND ts_measure >= ? AND ts_measure < ?
+ORDER BY ts_measure"""
+SQL_RANGE_AGGREGATE = """
+SELECT COUNT(rl_measurement), SUM(rl_measurement), MIN(rl_measurement), MAX(rl_measurement) FROM tbl_measure_ts
+WHERE id_sensor = ? AND ts_measure >= ? AND ts_measure < ?"""
+# meetup173 schema and query for comparison
+SQL_INDEX_MEETUP173 = "CREATE UNIQUE INDEX IF NOT EXISTS idx_sensor_time ON tbl_measure (dt_measure, id_sensor)"
+SQL_RANGE_MEETUP173 = """
+SELECT dt_measure, rl_measurement FROM tbl_measure
+WHERE id_sensor = ? AND dt_measure >= ? AND dt_measure < ?
+ORDER BY dt_measure"""
+DT_EPOCH = datetime.datetime(1970, 1, 1)
+ONE_SECOND = datetime.timedelta(seconds=1)
+
+
+def epoch(dt):
+    """Seconds since 1970-01-01 for naive datetime, taken as UTC (BCC times have no time zone)"""
+    return (dt - DT_EPOCH) // ONE_SECOND
+
+
+def dt_from_epoch(ts):
+    """Naive datetime from seconds since 1970-01-01"""
+    return DT_EPOCH + datetime.timedelta(seconds=ts)
+
+
+class MeasureStore:
+    """Measurements clustered by (id_sensor, ts_measure) in a WITHOUT ROWID table"""
+
+    def __init__(self, path="bpaml173_ts.db", page_size=PAGE_SIZE, cache_kib=CACHE_KIB, mmap_size=MMAP_SIZE):
+        """
+        :param path: sqlite database file
+        :param page_size: bytes per page. Only changes a new database (or after VACUUM)
+        :param cache_kib: KiB of pages cached in memory
+        :param mmap_size: bytes of database file read by memory mapping. 0 to turn off
+        """
+        self.con = sqlite3.connect(path)
+        self.con.execute(f"PRAGMA page_size = {int(page_size)}")
+        self.con.execute("PRAGMA journal_mode = WAL")
+        # With WAL, NORMAL is safe from corruption. A power failure may lose the last transactions
+        self.con.execute("PRAGMA synchronous = NORMAL")
+        self.con.execute(f"PRAGMA cache_size = {-int(cache_kib)}")
+        self.con.execute(f"PRAGMA mmap_size = {int(mmap_size)}")
+        self.con.execute("PRAGMA temp_store = MEMORY")
+        with self.con:
+            self.con.executescript(SQL_CREATE)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.con.close()
+
+    def insert(self, rows, batch_rows=bulk_load.BATCH_ROWS):
+        """Insert (dt_measure, id_sensor, rl_measurement) rows in transactions of batch_rows. Returns rows read"""
+        num = 0
+        for batch in bulk_load.iter_batches(rows, batch_rows):
+            # Every sensor in a BCC record has the same time so only convert each time once
+            dct_epoch = {dt_measure: epoch(dt_measure) for dt_measure in {row[0] for row in batch}}
+            lst_params = sorted((id_sensor, dct_epoch[dt_measure], rl_measurement)
+                                for dt_measure, id_sensor, rl_measurement in batch)
+            with self.con:
+                self.con.executemany(SQL_INSERT, lst_params)
+            num += len(batch)
+        return num
+
+    def range_rows(self, id_sensor, dt_from, dt_to):
+        """List of (datetime, rl_measurement) for sensor from dt_from up to but not including dt_to"""
+        cur = self.con.execute(SQL_RANGE, (id_sensor, epoch(dt_from), epoch(dt_to)))
+        return [(dt_from_epoch(ts), rl_measurement) for ts, rl_measurement in cur]
+
+    def range_epoch(self, id_sensor, ts_from, ts_to):
+        """List of (ts_measure, rl_measurement) for sensor, without converting times to datetime"""
+        return self.con.execute(SQL_RANGE, (id_sensor, ts_from, ts_to)).fetchall()
+
+    def range_aggregate(self, id_sensor, dt_from, dt_to):
+        """(count, sum, min, max) of measurements for sensor from dt_from up to but not including dt_to"""
+        return self.con.execute(SQL_RANGE_AGGREGATE, (id_sensor, epoch(dt_from), epoch(dt_to))).fetchone()
+
+
+def remove_db(path):
+    """Delete sqlite database file and its WAL files if they exist"""
+    for suffix in ["", "-wal", "-shm"]:
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def dct_latency(lst_seconds):
+    lst_ms = sorted(seconds * 1000 for seconds in lst_seconds)
+    return {'mean_ms': statistics.fmean(lst_ms), 'p95_ms': lst_ms[min(int(len(lst_ms) * 0.95), len(lst_ms) - 1)]}
+
+
+def benchmark(num_rows=1_000_000, num_queries=200, dir_db=".", seed=0):
+    """Ingest rate and one-sensor-one-day query latency for meetup173 schema and MeasureStore
+
+    :return: dict of 'meetup173' and 'measure_store' -> dict of rows_per_second, mean_ms and p95_ms
+    """
+    dct_result = {}
+    lst_sensor = [sensor[1] for sensor in bulk_load.lst_synthetic_sensors()]
+    dt_start = datetime.datetime(2024, 1, 1)
+    num_days = max(1, num_rows // (len(lst_sensor) * 288))
+    rng = random.Random(seed)
+    lst_query = [(rng.choice(lst_sensor), dt_start + datetime.timedelta(days=rng.randrange(num_days)))
+                 for _ in range(num_queries)]
+
+    path = os.path.join(dir_db, "bpaml173_benchmark.db")
+    remove_db(path)
+    con = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES)
+    bulk_load.create_tables(con, 'sqlite')
+    con.execute(SQL_INDEX_MEETUP173)
+    time_start = time.perf_counter()
+    num = bulk_load.load_sqlite_executemany(con, bulk_load.synthetic_rows(num_rows, dt_start=dt_start))
+    rows_per_second = num / (time.perf_counter() - time_start)
+    lst_seconds = []
+    for id_sensor, dt_from in lst_query:
+        time_start = time.perf_counter()
+        con.execute(SQL_RANGE_MEETUP173, (id_sensor, dt_from, dt_from + datetime.timedelta(days=1))).fetchall()
+        lst_seconds.append(time.perf_counter() - time_start)
+    con.close()
+    dct_result['meetup173'] = dict(dct_latency(lst_seconds), rows_per_second=rows_per_second)
+
+    path = os.path.join(dir_db, "bpaml173_ts_benchmark.db")
+    remove_db(path)
+    with MeasureStore(path) as store:
+        time_start = time.perf_counter()
+        num = store.insert(bulk_load.synthetic_rows(num_rows, dt_start=dt_start))
+        rows_per_second = num / (time.perf_counter() - time_start)
+        lst_seconds = []
+        for id_sensor, dt_from in lst_query:
+            time_start = time.perf_counter()
+            store.range_rows(id_sensor, dt_from, dt_from + datetime.timedelta(days=1))
+            lst_seconds.append(time.perf_counter() - time_start)
+    dct_result['measure_store'] = dict(dct_latency(lst_seconds), rows_per_second=rows_per_second)
+    return dct_result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MeetUp173 - compare meetup173 tbl_measure with MeasureStore")
+    parser.add_argument("-r", "--rows", type=int, default=1_000_000, help="number of measurements to load")
+    parser.add_argument("-q", "--queries", type=int, default=200, help="number of one sensor one day queries")
+    parser.add_argument("--dir", default=".", help="directory for benchmark databases")
+    parser.add_argument("-l", "--log", default="INFO", action="store", help="set log level. eg: --log INFO",
+                        type=str.upper, choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"])
+    args = parser.parse_args()
+    logging.basicConfig(level=getattr(logging, args.log))
+    print(f"{'schema':<16s}{'rows/s':>12s}{'mean ms':>10s}{'p95 ms':>10s}")
+    for schema, dct in benchmark(args.rows, args.queries, args.dir).items():
+        print(f"{schema:<16s}{dct['rows_per_second']:>12,.0f}{dct['mean_ms']:>10.3f}{dct['p95_ms']:>10.3f}")
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""MeetUp 204 - Beginners' Python and Machine Learning - async fetch and load of telemetry data
+
+Companion to meetup172_tim_retrieving_data.py, meetup173_tim_relational_database.py, meetup204_tim_postgresql.py
+and meetup204_tim_bulk_load.py
+
+meetup172, meetup173 and meetup204 get the rainfall and stream height data from the CKAN datastore_search API with
+requests.get, waiting for each page, and only then insert everything into tbl_measure. fetch_and_load overlaps the
+two:
+- The first page says how many records there are (result['total']). The remaining pages (offset, limit) are
+  downloaded by max_concurrent workers at once, so there are never more than max_concurrent requests to the server
+- Each page is unpivoted into (dt_measure, id_sensor, rl_measurement) rows with bulk_load.measure_rows and given to
+  a writer as soon as it arrives, while later pages are still downloading
+- Pages waiting to be written are held in a queue of max_concurrent pages, so if the database is slower than the
+  network the downloads wait rather than memory filling up
+Writers:
+- PsycopgCopyWriter uses psycopg's AsyncConnection and COPY FROM STDIN, one transaction per page
+- SqliteWriter collects rows and writes them with executemany in transactions of batch_rows rows
+Downloads use urllib in threads (asyncio.to_thread) so no extra http library is needed.
+
+self_check() runs fetch_and_load against a local stand-in datastore_search server (http.server) and checks the
+number of requests at once, that every page is requested once, the rows written and that a failing page raises.
+
+Usage:
+    import asyncio, sqlite3
+    import meetup204_tim_async_load as async_load
+    con = sqlite3.connect("bpaml173.db", detect_types=sqlite3.PARSE_DECLTYPES)
+    dct_result = asyncio.run(async_load.fetch_and_load(async_load.SqliteWriter(con)))
+
+Usage from command line:
+    python meetup204_tim_async_load.py --self-check
+
+To install third party libraries (only needed for postgresql)
+
+pip install psycopg[binary]
+"""
+
+# Standard libraries
+import argparse
+import asyncio
+import contextlib
+import datetime
+import http.server
+import json
+import logging
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+# Local modules
+import meetup204_tim_bulk_load as bulk_load
+
+logger = logging.getLogger(__name__)
+
+URL_DATASTORE = 'https://www.data.brisbane.qld.gov.au/data/api/3/action/datastore_search'
+RESOURCE_ID_DATA = '78c37b45-ecb5-4a99-86b2-f7a514f0f447'
+# Records per page requested from datastore_search
+PAGE_LIMIT = 1000
+# Most requests to the server at once
+MAX_CONCURRENT = 4
+
+
+def get_json(url, params, timeout=60):
+    """Blocking GET of url with query params. Returns decoded json"""
+    with urllib.request.urlopen(f"{url}?{urllib.parse.urlencode(params)}", timeout=timeout) as response:
+        return json.load(response)
+
+
+async def fetch_page(url, resource_id, offset, limit, timeout=60):
+    """result dict of one page of datastore_search"""
+    dct_json = await asyncio.to_thread(get_json, url, {'resource_id': resource_id, 'offset': offset, 'limit': limit},
+                                       timeout)
+    if not dct_json.get('success', True):
+        raise RuntimeError(f"fetch_page: datastore_search failed at offset {offset}: {dct_json.get('error')}")
+    return dct_json['result']
+
+
+class SqliteWriter:
+    """Writes rows to tbl_measure in a sqlite3 database in transactions of batch_rows rows"""
+
+    def __init__(self, con, batch_rows=bulk_load.BATCH_ROWS):
+        self.con = con
+        self.batch_rows = batch_rows
+        self.lst_row = []
+        self.num_rows = 0
+
+    async def write(self, rows):
+        self.lst_row.extend(rows)
+        if len(self.lst_row) >= self.batch_rows:
+            await self.flush()
+
+    async def flush(self):
+        # sqlite3 is blocking but a batch only takes a fraction of a second. Downloads carry on in their threads
+        self.num_rows += bulk_load.load_sqlite_executemany(self.con, self.lst_row, self.batch_rows)
+        self.lst_row = []
+
+
+class PsycopgCopyWriter:
+    """Writes rows to tbl_measure with COPY on a psycopg AsyncConnection, one transaction per page"""
+
+    def __init__(self, aconn):
+        self.aconn = aconn
+        self.num_rows = 0
+
+    async def write(self, rows):
+        async with self.aconn.cursor() as cur:
+            async with cur.copy(bulk_load.SQL_COPY) as copy:
+                for row in rows:
+                    await copy.write_row(row)
+                    self.num_rows += 1
+        await self.aconn.commit()
+
+    async def flush(self):
+        pass
+
+
+async def fetch_and_load(writer, url=URL_DATASTORE, resource_id=RESOURCE_ID_DATA, limit=PAGE_LIMIT,
+                         max_concurrent=MAX_CONCURRENT, timeout=60):
+    """Download every page of resource_id and write its measurements with writer while other pages download
+
+    :param writer: SqliteWriter or PsycopgCopyWriter (anything with async write(rows) and flush())
+    :param url: CKAN datastore_search URL
+    :param resource_id: CKAN resource with one record per time and one field per sensor
+    :param limit: records per page
+    :param max_concurrent: most requests at once, also most pages waiting to be written
+    :param timeout: seconds to wait for each page
+    :return: dict of num_pages, num_records, num_rows and seconds
+    """
+    time_start = time.perf_counter()
+    result = await fetch_page(url, resource_id, 0, limit, timeout)
+    total = result.get('total', len(result['records']))
+    lst_offset = list(range(limit, total, limit))
+    q_offset = asyncio.Queue()
+    for offset in lst_offset:
+        q_offset.put_nowait(offset)
+    q_page = asyncio.Queue(maxsize=max_concurrent)
+    dct_count = {'num_pages': 0, 'num_records': 0}
+
+    async def download():
+        while not q_offset.empty():
+            offset = q_offset.get_nowait()
+            await q_page.put((await fetch_page(url, resource_id, offset, limit, timeout))['records'])
+
+    async def load(lst_records):
+        await writer.write(list(bulk_load.measure_rows(lst_records)))
+        dct_count['num_pages'] += 1
+        dct_count['num_records'] += len(lst_records)
+        logger.debug(f"fetch_and_load: page {dct_count['num_pages']} {dct_count['num_records']}/{total} records")
+
+    async def load_all():
+        await load(result['records'])
+        for _ in lst_offset:
+            await load(await q_page.get())
+        await writer.flush()
+
+    lst_task = [asyncio.create_task(download()) for _ in range(min(max_concurrent, len(lst_offset)))]
+    lst_task.append(asyncio.create_task(load_all()))
+    try:
+        # Raises the first exception from any download or write, rather than waiting for pages which won't come
+        await asyncio.gather(*lst_task)
+    finally:
+        for task in lst_task:
+            task.cancel()
+    return dict(dct_count, num_rows=writer.num_rows, seconds=time.perf_counter() - time_start)
+
+
+SQL_CREATE_MEASURE = """
+CREATE TABLE IF NOT EXISTS tbl_measure (
+    dt_measure TIMESTAMP NOT NULL,
+    id_sensor TEXT NOT NULL,
+    rl_measurement REAL);"""
+
+
+def synthetic_record(i):
+    """Record i of stand-in datastore_search, one every 5 minutes, with a '-' (no value) every third record"""
+    dt_measure = datetime.datetime(2024, 1, 1) + datetime.timedelta(minutes=5 * i)
+    return {'_id': i, 'Measured': dt_measure.strftime(bulk_load.FMT_MEASURED), 'E1': i * 0.5,
+            'E2': '-' if i % 3 == 0 else 1.0, 'E3': 2.0}
+
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    """datastore_search of server.total synthetic records. Answers 500 for offsets in server.set_fail_offset"""
+
+    def do_GET(self):
+        dct_query = dict(urllib.parse.parse_qsl(urllib.parse.urlparse(self.path).query))
+        offset, limit = int(dct_query['offset']), int(dct_query['limit'])
+        server = self.server
+        with server.lock:
+            server.lst_offset.append(offset)
+            server.num_in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.num_in_flight)
+        # Slow enough that requests overlap
+        time.sleep(0.02)
+        with server.lock:
+            server.num_in_flight -= 1
+        if offset in server.set_fail_offset:
+            self.send_error(500)
+            return
+        lst_record = [synthetic_record(i) for i in range(offset, min(offset + limit, server.total))]
+        body = json.dumps({'success': True, 'result': {'total': server.total, 'records': lst_record}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"StandInHandler: {format % args}")
+
+
+def self_check(total=2345, limit=100, max_concurrent=3):
+    """fetch_and_load with SqliteWriter against a local stand-in server. Raises AssertionError if wrong"""
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.lock = threading.Lock()
+    server.total = total
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/api/3/action/datastore_search"
+    lst_expected = sorted(bulk_load.measure_rows([synthetic_record(i) for i in range(total)]))
+    try:
+        for set_fail_offset in [set(), {limit * (total // limit // 2)}]:
+            server.lst_offset, server.set_fail_offset = [], set_fail_offset
+            server.num_in_flight, server.max_in_flight = 0, 0
+            with contextlib.closing(sqlite3.connect(":memory:", detect_types=sqlite3.PARSE_DECLTYPES)) as con:
+                con.executescript(SQL_CREATE_MEASURE)
+                try:
+                    dct_result = asyncio.run(fetch_and_load(SqliteWriter(con, batch_rows=500), url, "stand-in", limit,
+                                                            max_concurrent))
+                except urllib.error.HTTPError as e:
+                    assert set_fail_offset and e.code == 500, f"unexpected {e}"
+                    print(f"self_check: page at offset {min(set_fail_offset)} failed so fetch_and_load raised {e}")
+                    continue
+                assert not set_fail_offset, "fetch_and_load should raise when a page fails"
+                # First page gives total, then every other page once
+                assert server.lst_offset[0] == 0, server.lst_offset
+                assert sorted(server.lst_offset) == list(range(0, total, limit)), server.lst_offset
+                assert server.max_in_flight <= max_concurrent, server.max_in_flight
+                lst_row = sorted(con.execute("SELECT dt_measure, id_sensor, rl_measurement FROM tbl_measure"))
+                assert lst_row == lst_expected, f"{len(lst_row)} rows written, {len(lst_expected)} expected"
+                assert (dct_result['num_records'], dct_result['num_rows']) == (total, len(lst_expected)), dct_result
+                print(f"self_check: {dct_result['num_pages']} pages, {dct_result['num_rows']} rows, "
+                      f"at most {server.max_in_flight} requests at once")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MeetUp204 - fetch BCC telemetry and load into sqlite")
+    parser.add_argument("--self-check", action="store_true", help="check against a local stand-in server")
+    parser.add_argument("-l", "--log", default="INFO", action="store", help="set log level. eg: --log INFO",
+                        type=str.upper, choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"])
+    args = parser.parse_args()
+    logging.basicConfig(level=getattr(logging, args.log))
+    if args.self_check:
+        self_check()
+        raise SystemExit
+    sqlite_con = sqlite3.connect("bpaml173.db", detect_types=sqlite3.PARSE_DECLTYPES)
+    sqlite_con.executescript(SQL_CREATE_MEASURE)
+    print(asyncio.run(fetch_and_load(SqliteWriter(sqlite_con))))
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""MeetUp 204 - Beginners' Python and Machine Learning - bulk loading telemetry measurements
+
+Companion to meetup173_tim_relational_database.py (sqlite3) and meetup204_tim_postgresql.py (psycopg)
+
+Both sessions unpivot the rainfall and stream height data into tbl_measure (one row per sensor per time) and insert
+the rows with execute() per row, then executemany(), then (postgresql only) cur.copy(). This module puts all of
+those behind one function so the fastest way can be picked for each database:
+
+    bulk_load(conn, rows, backend)
+
+where rows is any iterable of (dt_measure, id_sensor, rl_measurement) tuples, eg measure_rows(lst_data_raw), and
+backend is one of BACKENDS:
+- sqlite_execute        one execute() per row (as meetup173 Solution 6)
+- sqlite_executemany    executemany() in transactions of batch_rows rows (as meetup173 Solution 7, but batched)
+- psycopg_execute       one execute() per row (as meetup204 Solution 6)
+- psycopg_executemany   executemany() in pipeline mode, so rows are sent without waiting for each reply
+- psycopg_copy          COPY FROM STDIN in text format (as meetup204 Solution 7)
+- psycopg_copy_binary   COPY FROM STDIN in binary format, no converting numbers and dates to text and back
+Rows are loaded in batches of batch_rows, each committed, so memory use doesn't grow with the number of rows.
+
+The benchmark creates empty tables, loads synthetic measurements (10,000 to 10,000,000 rows by default) with each
+backend and reports rows per second. 'generate' only creates the synthetic rows so shows the most any backend could
+do.
+
+Usage from command line:
+    python meetup204_tim_bulk_load.py --backend sqlite_executemany sqlite_execute --sizes 10000 100000
+    python meetup204_tim_bulk_load.py --backend psycopg_copy_binary psycopg_executemany --config db_config.ini
+
+To install third party libraries (only needed for postgresql)
+
+pip install psycopg[binary]
+"""
+
+# Standard libraries
+import argparse
+import configparser
+import datetime
+import itertools
+import logging
+import random
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+FMT_MEASURED = '%Y-%m-%dT%H:%M:%S'
+# Keys in each record of measurement data from BCC which aren't sensor ids
+KEYS_NOT_SENSOR = ('_id', 'Measured', 'dt_measure')
+# Rows per transaction
+BATCH_ROWS = 50_000
+SIZES = (10_000, 100_000, 1_000_000, 10_000_000)
+# Backends doing a round trip per row are skipped in benchmark for more rows than this
+MAX_ROWS_PER_ROW_BACKEND = 100_000
+NUM_SENSORS = 100
+
+SQL_CREATE_SQLITE = """
+DROP TABLE IF EXISTS tbl_measure;
+DROP TABLE IF EXISTS tbl_sensor;
+CREATE TABLE tbl_sensor (
+    _id           INTEGER,
+    id_sensor     TEXT    PRIMARY KEY,
+    id_location   TEXT,
+    txt_location  TEXT,
+    txt_type      TEXT,
+    txt_unit      TEXT,
+    deg_latitude  REAL,
+    deg_longitude REAL);
+CREATE TABLE tbl_measure (
+    dt_measure TIMESTAMP NOT NULL,
+    id_sensor TEXT NOT NULL,
+    rl_measurement REAL,
+    FOREIGN KEY (id_sensor) REFERENCES tbl_sensor (id_sensor));
+"""
+SQL_CREATE_POSTGRESQL = """
+DROP TABLE IF EXISTS tbl_measure;
+DROP TABLE IF EXISTS tbl_sensor;
+CREATE TABLE tbl_sensor (
+    _id           INTEGER,
+    id_sensor     TEXT    PRIMARY KEY,
+    id_location   TEXT,
+    txt_location  TEXT,
+    txt_type      TEXT,
+    txt_unit      TEXT,
+    deg_latitude  DOUBLE PRECISION,
+    deg_longitude DOUBLE PRECISION);
+CREATE TABLE tbl_measure (
+    dt_measure TIMESTAMP NOT NULL,
+    id_sensor TEXT NOT NULL,
+    rl_measurement REAL,
+    FOREIGN KEY (id_sensor) REFERENCES tbl_sensor (id_sensor));
+"""
+SQL_INSERT_SENSOR_SQLITE = "INSERT INTO tbl_sensor (_id, id_sensor, txt_type, txt_unit) VALUES (?, ?, ?, ?)"
+SQL_INSERT_SENSOR_POSTGRESQL = "INSERT INTO tbl_sensor (_id, id_sensor, txt_type, txt_unit) VALUES (%s, %s, %s, %s)"
+SQL_INSERT_SQLITE = "INSERT INTO tbl_measure (dt_measure, id_sensor, rl_measurement) VALUES (?, ?, ?)"
+SQL_INSERT_POSTGRESQL = "INSERT INTO tbl_measure (dt_measure, id_sensor, rl_measurement) VALUES (%s, %s, %s)"
+SQL_COPY = "COPY tbl_measure (dt_measure, id_sensor, rl_measurement) FROM STDIN"
+SQL_COPY_BINARY = "COPY tbl_measure (dt_measure, id_sensor, rl_measurement) FROM STDIN (FORMAT BINARY)"
+
+
+def read_db_config(filename="db_config.ini", section="postgresql"):
+    """dict of connection parameters from ini file section, as in meetup204"""
+    parser = configparser.ConfigParser()
+    if not parser.read(filename):
+        raise FileNotFoundError(f"read_db_config: can't read {filename}")
+    return {param[0]: param[1] for param in parser.items(section)}
+
+
+def measure_rows(lst_data_raw):
+    """(dt_measure, id_sensor, rl_measurement) for each sensor in each record of BCC data. '-' (no value) skipped"""
+    for raw in lst_data_raw:
+        dt_measure = datetime.datetime.strptime(raw['Measured'], FMT_MEASURED)
+        for k, v in raw.items():
+            if k not in KEYS_NOT_SENSOR and v != '-':
+                yield dt_measure, k, float(v)
+
+
+def lst_synthetic_sensors(num_sensors=NUM_SENSORS):
+    """(_id, id_sensor, txt_type, txt_unit) for synthetic sensors"""
+    return [(i, f"S{i:04d}", "Rainfall" if i % 2 == 0 else "Stream height", "mm" if i % 2 == 0 else "m")
+            for i in range(num_sensors)]
+
+
+def synthetic_rows(num_rows, num_sensors=NUM_SENSORS, dt_start=datetime.datetime(2024, 1, 1), minutes=5, seed=0):
+    """num_rows measurements, every sensor every minutes from dt_start, like BCC data"""
+    rng = random.Random(seed)
+    lst_id_sensor = [sensor[1] for sensor in lst_synthetic_sensors(num_sensors)]
+    interval = datetime.timedelta(minutes=minutes)
+    dt_measure = dt_start
+    num = 0
+    while num < num_rows:
+        for id_sensor in lst_id_sensor[:num_rows - num]:
+            yield dt_measure, id_sensor, round(rng.random() * 10, 1)
+        num += min(num_sensors, num_rows - num)
+        dt_measure += interval
+
+
+def iter_batches(rows, batch_rows=BATCH_ROWS):
+    """Lists of up to batch_rows rows from rows"""
+    it = iter(rows)
+    while batch := list(itertools.islice(it, batch_rows)):
+        yield batch
+
+
+def sqlite_params(batch):
+    # Same str as sqlite3's default datetime adapter so PARSE_DECLTYPES reads them back as datetime
+    return [(dt_measure.isoformat(" "), id_sensor, rl_measurement) for dt_measure, id_sensor, rl_measurement in batch]
+
+
+def load_sqlite_execute(con, rows, batch_rows=BATCH_ROWS):
+    num = 0
+    for batch in iter_batches(rows, batch_rows):
+        with con:
+            for params in sqlite_params(batch):
+                con.execute(SQL_INSERT_SQLITE, params)
+        num += len(batch)
+    return num
+
+
+def load_sqlite_executemany(con, rows, batch_rows=BATCH_ROWS):
+    num = 0
+    for batch in iter_batches(rows, batch_rows):
+        with con:
+            con.executemany(SQL_INSERT_SQLITE, sqlite_params(batch))
+        num += len(batch)
+    return num
+
+
+def load_psycopg_execute(conn, rows, batch_rows=BATCH_ROWS):
+    num = 0
+    for batch in iter_batches(rows, batch_rows):
+        with conn.cursor() as cur:
+            for params in batch:
+                cur.execute(SQL_INSERT_POSTGRESQL, params)
+        conn.commit()
+        num += len(batch)
+    return num
+
+
+def load_psycopg_executemany(conn, rows, batch_rows=BATCH_ROWS):
+    num = 0
+    for batch in iter_batches(rows, batch_rows):
+        # Pipeline mode sends the next row without waiting for the server to reply to the last one
+        with conn.pipeline(), conn.cursor() as cur:
+            cur.executemany(SQL_INSERT_POSTGRESQL, batch)
+        conn.commit()
+        num += len(batch)
+    return num
+
+
+def load_psycopg_copy(conn, rows, batch_rows=BATCH_ROWS):
+    num = 0
+    for batch in iter_batches(rows, batch_rows):
+        with conn.cursor() as cur, cur.copy(SQL_COPY) as copy:
+            for row in batch:
+                copy.write_row(row)
+        conn.commit()
+        num += len(batch)
+    return num
+
+
+def load_psycopg_copy_binary(conn, rows, batch_rows=BATCH_ROWS):
+    num = 0
+    for batch in iter_batches(rows, batch_rows):
+        with conn.cursor() as cur, cur.copy(SQL_COPY_BINARY) as copy:
+            # Binary format needs the exact column types. Python float would be sent as float8 not REAL (float4)
+            copy.set_types(["timestamp", "text", "float4"])
+            for row in batch:
+                copy.write_row(row)
+        conn.commit()
+        num += len(batch)
+    return num
+
+
+def load_none(conn, rows, batch_rows=BATCH_ROWS):
+    """Only iterate over rows. Shows how long creating the rows takes"""
+    return sum(len(batch) for batch in iter_batches(rows, batch_rows))
+
+
+# name -> (database, function)
+BACKENDS = {
+    'generate': (None, load_none),
+    'sqlite_execute': ('sqlite', load_sqlite_execute),
+    'sqlite_executemany': ('sqlite', load_sqlite_executemany),
+    'psycopg_execute': ('postgresql', load_psycopg_execute),
+    'psycopg_executemany': ('postgresql', load_psycopg_executemany),
+    'psycopg_copy': ('postgresql', load_psycopg_copy),
+    'psycopg_copy_binary': ('postgresql', load_psycopg_copy_binary),
+}
+BACKENDS_PER_ROW = ('sqlite_execute', 'psycopg_execute')
+
+
+def bulk_load(conn, rows, backend='sqlite_executemany', batch_rows=BATCH_ROWS):
+    """Insert rows of (dt_measure, id_sensor, rl_measurement) into tbl_measure. Returns number of rows
+
+    :param conn: sqlite3 connection for sqlite backends, psycopg connection for psycopg backends
+    :param rows: iterable of (datetime, str, float)
+    :param backend: one of BACKENDS
+    :param batch_rows: rows per transaction
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"bulk_load: backend must be one of {list(BACKENDS)} not {backend}")
+    return BACKENDS[backend][1](conn, rows, batch_rows)
+
+
+def create_tables(conn, database, num_sensors=NUM_SENSORS):
+    """Empty tbl_sensor and tbl_measure with synthetic sensors"""
+    if database == 'sqlite':
+        with conn:
+            conn.executescript(SQL_CREATE_SQLITE)
+            conn.executemany(SQL_INSERT_SENSOR_SQLITE, lst_synthetic_sensors(num_sensors))
+    else:
+        with conn.cursor() as cur:
+            cur.execute(SQL_CREATE_POSTGRESQL)
+            cur.executemany(SQL_INSERT_SENSOR_POSTGRESQL, lst_synthetic_sensors(num_sensors))
+        conn.commit()
+
+
+def connect(database, db_file="bpaml_bulk_load.db", dct_db_config=None):
+    if database == 'postgresql':
+        # Only needed for postgresql so sqlite backends work without it installed
+        import psycopg
+        return psycopg.connect(**dct_db_config)
+    return sqlite3.connect(db_file, detect_types=sqlite3.PARSE_DECLTYPES)
+
+
+def benchmark(backend, num_rows, db_file="bpaml_bulk_load.db", dct_db_config=None, batch_rows=BATCH_ROWS):
+    """Load num_rows synthetic measurements into empty tables using backend
+
+    :return: dict of backend, num_rows, seconds and rows_per_second
+    """
+    database = BACKENDS[backend][0]
+    conn = connect(database or 'sqlite', db_file, dct_db_config)
+    try:
+        if database is not None:
+            create_tables(conn, database)
+        rows = synthetic_rows(num_rows)
+        time_start = time.perf_counter()
+        num = bulk_load(conn, rows, backend, batch_rows)
+        seconds = time.perf_counter() - time_start
+    finally:
+        conn.close()
+    return {'backend': backend, 'num_rows': num, 'seconds': seconds, 'rows_per_second': num / seconds}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MeetUp204 - compare ways of loading measurements into tbl_measure")
+    parser.add_argument("-b", "--backend", nargs="+", default=['generate', 'sqlite_execute', 'sqlite_executemany'],
+                        choices=list(BACKENDS), help="backends to benchmark")
+    parser.add_argument("-s", "--sizes", nargs="+", type=int, default=list(SIZES), help="numbers of rows to load")
+    parser.add_argument("--batch-rows", type=int, default=BATCH_ROWS, help="rows per transaction")
+    parser.add_argument("--db", default="bpaml_bulk_load.db", help="sqlite database file")
+    parser.add_argument("--config", default="db_config.ini", help="ini file with [postgresql] section")
+    parser.add_argument("-l", "--log", default="INFO", action="store", help="set log level. eg: --log INFO",
+                        type=str.upper, choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"])
+    args = parser.parse_args()
+    logging.basicConfig(level=getattr(logging, args.log))
+    db_config = None
+    if any(BACKENDS[b][0] == 'postgresql' for b in args.backend):
+        db_config = read_db_config(args.config)
+    print(f"{'backend':<22s}{'rows':>12s}{'seconds':>10s}{'rows/s':>12s}")
+    for size in args.sizes:
+        for name in args.backend:
+            if name in BACKENDS_PER_ROW and size > MAX_ROWS_PER_ROW_BACKEND:
+                logger.info(f"Skipping {name} for {size} rows. Use --sizes {MAX_ROWS_PER_ROW_BACKEND} or less")
+                continue
+            dct = benchmark(name, size, args.db, db_config, args.batch_rows)
+            print(f"{dct['backend']:<22s}{dct['num_rows']:>12,d}"
+                  f"{dct['seconds']:>10.2f}{dct['rows_per_second']:>12,.0f}")
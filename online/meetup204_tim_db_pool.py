@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""MeetUp 204 - Beginners' Python and Machine Learning - connection pool for psycopg
+
+Companion to meetup204_tim_postgresql.py
+
+Almost every query in meetup204 starts with psycopg.connect(**dct_db_config) so each one pays for a TCP connection,
+authentication and a new postgresql backend process before it runs. Database keeps connections open in a
+psycopg_pool.ConnectionPool, configured from the same [postgresql] section of db_config.ini, and lends them out:
+- with db.connection() as conn: ...   check out a connection, commit (or rollback on exception) and return it
+- db.fetch_all(sql, params, row_factory='dict')   run one query on a pooled connection
+- row_factory is 'tuple', 'dict' or 'namedtuple' (or any psycopg row factory) as in meetup204
+- Connections stay open so psycopg's prepared statements are reused. Queries run prepare_threshold times on a
+  connection are prepared automatically, or pass prepare=True to prepare the first time
+AsyncDatabase is the same using psycopg_pool.AsyncConnectionPool for asyncio code.
+
+The benchmark runs the same query with a new connection each time (as meetup204) and with the pool.
+
+Usage:
+    import meetup204_tim_db_pool as db_pool
+    with db_pool.Database() as db:
+        for row in db.fetch_all("SELECT * FROM tbl_sensor WHERE txt_type=%s", ("Rainfall",), row_factory='dict'):
+            print(row)
+
+Usage from command line:
+    python meetup204_tim_db_pool.py --config db_config.ini --queries 1000
+
+To install third party libraries
+
+pip install psycopg[binary] psycopg_pool
+"""
+
+# Standard libraries
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+# Third party libraries
+import psycopg
+import psycopg.rows
+import psycopg_pool
+# Local modules
+import meetup204_tim_bulk_load as bulk_load
+
+logger = logging.getLogger(__name__)
+
+ROW_FACTORIES = {
+    'tuple': psycopg.rows.tuple_row,
+    'dict': psycopg.rows.dict_row,
+    'namedtuple': psycopg.rows.namedtuple_row,
+}
+MIN_SIZE = 1
+MAX_SIZE = 10
+# Executions of the same query on a connection before psycopg prepares it (psycopg default is 5)
+PREPARE_THRESHOLD = 5
+SQL_BENCHMARK = "SELECT COUNT(*) FROM tbl_sensor WHERE txt_type = %s"
+
+
+def row_factory_for(row_factory):
+    """psycopg row factory from name in ROW_FACTORIES, or row_factory itself if it isn't a str"""
+    if isinstance(row_factory, str):
+        if row_factory not in ROW_FACTORIES:
+            raise ValueError(f"row_factory_for: row_factory must be one of {list(ROW_FACTORIES)} not {row_factory}")
+        return ROW_FACTORIES[row_factory]
+    return row_factory
+
+
+def pool_kwargs(dct_db_config, filename, section, min_size, max_size, prepare_threshold):
+    if dct_db_config is None:
+        dct_db_config = bulk_load.read_db_config(filename, section)
+    return {
+        'conninfo': psycopg.conninfo.make_conninfo(**dct_db_config),
+        'min_size': min_size,
+        'max_size': max_size,
+        'kwargs': {'prepare_threshold': prepare_threshold},
+    }
+
+
+class Database:
+    """Pool of psycopg connections with helpers to run queries on them"""
+
+    def __init__(self, dct_db_config=None, filename="db_config.ini", section="postgresql", min_size=MIN_SIZE,
+                 max_size=MAX_SIZE, row_factory='tuple', prepare_threshold=PREPARE_THRESHOLD):
+        """
+        :param dct_db_config: connection parameters, eg host, dbname, user, password. None to read from filename
+        :param filename: ini file with connection parameters
+        :param section: section of ini file
+        :param min_size: connections kept open even when not in use
+        :param max_size: most connections open at once. Further checkouts wait for one to be returned
+        :param row_factory: default for queries. 'tuple', 'dict', 'namedtuple' or a psycopg row factory
+        :param prepare_threshold: executions of a query on a connection before it is prepared. None never prepares
+        """
+        self.row_factory = row_factory_for(row_factory)
+        self.pool = psycopg_pool.ConnectionPool(
+            **pool_kwargs(dct_db_config, filename, section, min_size, max_size, prepare_threshold), open=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.pool.close()
+
+    def connection(self, timeout=None):
+        """Context manager checking out a connection. Commits (or rolls back on exception) when returned"""
+        return self.pool.connection(timeout=timeout)
+
+    def fetch_all(self, sql, params=None, row_factory=None, prepare=None):
+        """List of rows from query"""
+        factory = row_factory_for(row_factory or self.row_factory)
+        with self.connection() as conn, conn.cursor(row_factory=factory) as cur:
+            cur.execute(sql, params, prepare=prepare)
+            return cur.fetchall()
+
+    def fetch_one(self, sql, params=None, row_factory=None, prepare=None):
+        """First row from query or None"""
+        factory = row_factory_for(row_factory or self.row_factory)
+        with self.connection() as conn, conn.cursor(row_factory=factory) as cur:
+            cur.execute(sql, params, prepare=prepare)
+            return cur.fetchone()
+
+    def execute(self, sql, params=None, prepare=None):
+        """Run sql which doesn't return rows (eg INSERT, UPDATE, DELETE). Returns rowcount"""
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute(sql, params, prepare=prepare)
+            return cur.rowcount
+
+    def execute_many(self, sql, params_seq):
+        """Run sql once for each params in params_seq in one transaction. Returns rowcount"""
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.executemany(sql, params_seq)
+            return cur.rowcount
+
+
+class AsyncDatabase:
+    """Pool of psycopg async connections with helpers to run queries on them. Use async with or await open()"""
+
+    def __init__(self, dct_db_config=None, filename="db_config.ini", section="postgresql", min_size=MIN_SIZE,
+                 max_size=MAX_SIZE, row_factory='tuple', prepare_threshold=PREPARE_THRESHOLD):
+        """Same parameters as Database"""
+        self.row_factory = row_factory_for(row_factory)
+        # Async pools can't be opened in __init__ because there may not be a running event loop
+        self.pool = psycopg_pool.AsyncConnectionPool(
+            **pool_kwargs(dct_db_config, filename, section, min_size, max_size, prepare_threshold), open=False)
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def open(self):
+        await self.pool.open()
+
+    async def close(self):
+        await self.pool.close()
+
+    def connection(self, timeout=None):
+        """Async context manager checking out a connection. Commits (or rolls back on exception) when returned"""
+        return self.pool.connection(timeout=timeout)
+
+    async def fetch_all(self, sql, params=None, row_factory=None, prepare=None):
+        """List of rows from query"""
+        async with self.connection() as conn:
+            async with conn.cursor(row_factory=row_factory_for(row_factory or self.row_factory)) as cur:
+                await cur.execute(sql, params, prepare=prepare)
+                return await cur.fetchall()
+
+    async def fetch_one(self, sql, params=None, row_factory=None, prepare=None):
+        """First row from query or None"""
+        async with self.connection() as conn:
+            async with conn.cursor(row_factory=row_factory_for(row_factory or self.row_factory)) as cur:
+                await cur.execute(sql, params, prepare=prepare)
+                return await cur.fetchone()
+
+    async def execute(self, sql, params=None, prepare=None):
+        """Run sql which doesn't return rows (eg INSERT, UPDATE, DELETE). Returns rowcount"""
+        async with self.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(sql, params, prepare=prepare)
+                return cur.rowcount
+
+    async def execute_many(self, sql, params_seq):
+        """Run sql once for each params in params_seq in one transaction. Returns rowcount"""
+        async with self.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.executemany(sql, params_seq)
+                return cur.rowcount
+
+
+def dct_latency(lst_seconds):
+    """Mean, median and 95th percentile in milliseconds"""
+    lst_ms = sorted(seconds * 1000 for seconds in lst_seconds)
+    return {
+        'num_queries': len(lst_ms),
+        'mean_ms': statistics.fmean(lst_ms),
+        'p50_ms': lst_ms[len(lst_ms) // 2],
+        'p95_ms': lst_ms[min(int(len(lst_ms) * 0.95), len(lst_ms) - 1)],
+    }
+
+
+def benchmark(dct_db_config, num_queries=1000, sql=SQL_BENCHMARK, params=("Rainfall",)):
+    """Latency of a query with a new connection each time (as meetup204) and with a pool
+
+    :return: dict of 'connect', 'pool' and 'async_pool' -> dict of latencies
+    """
+    lst_seconds = []
+    for i in range(num_queries):
+        time_start = time.perf_counter()
+        with psycopg.connect(**dct_db_config) as conn, conn.execute(sql, params) as cur:
+            cur.fetchall()
+        lst_seconds.append(time.perf_counter() - time_start)
+    dct_result = {'connect': dct_latency(lst_seconds)}
+
+    with Database(dct_db_config) as db:
+        db.pool.wait()
+        lst_seconds = []
+        for i in range(num_queries):
+            time_start = time.perf_counter()
+            db.fetch_all(sql, params)
+            lst_seconds.append(time.perf_counter() - time_start)
+    dct_result['pool'] = dct_latency(lst_seconds)
+
+    async def async_latencies():
+        async with AsyncDatabase(dct_db_config) as adb:
+            await adb.pool.wait()
+            lst_async_seconds = []
+            for _ in range(num_queries):
+                async_time_start = time.perf_counter()
+                await adb.fetch_all(sql, params)
+                lst_async_seconds.append(time.perf_counter() - async_time_start)
+            return lst_async_seconds
+
+    dct_result['async_pool'] = dct_latency(asyncio.run(async_latencies()))
+    return dct_result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MeetUp204 - query latency with and without a connection pool")
+    parser.add_argument("--config", default="db_config.ini", help="ini file with [postgresql] section")
+    parser.add_argument("-n", "--queries", type=int, default=1000, help="number of queries for each method")
+    parser.add_argument("-l", "--log", default="INFO", action="store", help="set log level. eg: --log INFO",
+                        type=str.upper, choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"])
+    args = parser.parse_args()
+    logging.basicConfig(level=getattr(logging, args.log))
+    dct_benchmark = benchmark(bulk_load.read_db_config(args.config), args.queries)
+    print(f"{'method':<12s}{'queries':>10s}{'mean ms':>10s}{'p50 ms':>10s}{'p95 ms':>10s}")
+    for method, dct in dct_benchmark.items():
+        print(f"{method:<12s}{dct['num_queries']:>10d}"
+              f"{dct['mean_ms']:>10.3f}{dct['p50_ms']:>10.3f}{dct['p95_ms']:>10.3f}")
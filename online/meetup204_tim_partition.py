@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""MeetUp 204 - Beginners' Python and Machine Learning - monthly partitions and BRIN index for tbl_measure
+
+Companion to meetup204_tim_postgresql.py and meetup204_tim_bulk_load.py
+
+meetup204 creates tbl_measure as one table with a unique btree index on (dt_measure, id_sensor), and every query
+(eg the GROUP BY id_sensor, txt_unit aggregate) reads the whole table. BCC sensors measure every 5 minutes, so years
+of measurements are hundreds of millions of rows.
+
+Here tbl_measure is declared PARTITION BY RANGE (dt_measure) with one partition per month:
+- create_partitioned_table() creates the parent table, the unique index from meetup204 and a BRIN index on
+  dt_measure. Indexes on the parent are created on every partition automatically
+- ensure_partitions() creates the partitions (eg tbl_measure_y2024m06) for a range of dates if they don't exist.
+  load() calls it for each batch before bulk loading so partitions are created on ingest
+- BRIN (block range) indexes store the lowest and highest dt_measure of each range of pages. Measurements arrive
+  in time order so they are tiny (kilobytes instead of gigabytes for a btree) and still skip most of a partition
+- Queries with WHERE dt_measure >= %s AND dt_measure < %s only read the partitions for those months (partition
+  pruning) so a date bounded JOIN with tbl_sensor takes time proportional to the months asked for, not to the
+  size of tbl_measure. explain() shows which partitions a query reads
+- drop_partitions_before() removes old months instantly instead of a slow DELETE
+
+Usage:
+    import meetup204_tim_partition as partition
+    with psycopg.connect(**dct_db_config) as conn:
+        partition.create_partitioned_table(conn)
+        partition.load(conn, bulk_load.measure_rows(lst_data_raw))
+        lst_row = partition.fetch_aggregate(conn, datetime.datetime(2024, 6, 1), datetime.datetime(2024, 7, 1))
+
+To install third party libraries
+
+pip install psycopg[binary]
+"""
+
+# Standard libraries
+import datetime
+import logging
+import re
+# Third party libraries
+import psycopg
+import psycopg.rows
+from psycopg import sql
+# Local modules
+import meetup204_tim_bulk_load as bulk_load
+
+logger = logging.getLogger(__name__)
+
+TABLE = "tbl_measure"
+# Pages summarised by each BRIN entry. Smaller is more precise but a bigger index
+BRIN_PAGES_PER_RANGE = 32
+# Partition names are table_yYYYYmMM
+RE_PARTITION = re.compile(r"_y(\d{4})m(\d{2})$")
+
+SQL_CREATE = """
+CREATE TABLE {table} (
+    dt_measure TIMESTAMP NOT NULL,
+    id_sensor TEXT NOT NULL,
+    rl_measurement REAL,
+    FOREIGN KEY (id_sensor) REFERENCES tbl_sensor (id_sensor)) PARTITION BY RANGE (dt_measure)"""
+SQL_UNIQUE = "CREATE UNIQUE INDEX IF NOT EXISTS {index} ON {table} (dt_measure, id_sensor)"
+SQL_BRIN = "CREATE INDEX IF NOT EXISTS {index} ON {table} USING BRIN (dt_measure) WITH (pages_per_range = {pages})"
+SQL_PARTITION = "CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {table} FOR VALUES FROM ({dt_from}) TO ({dt_to})"
+SQL_PARTITIONS = """
+SELECT c.relname FROM pg_inherits i
+JOIN pg_class c ON c.oid = i.inhrelid
+JOIN pg_class p ON p.oid = i.inhparent
+WHERE p.relname = %s"""
+# meetup204 aggregate, bounded by date so only partitions for those months are read
+SQL_AGGREGATE = """
+SELECT COUNT(*) as frequency, SUM(rl_measurement) as total,
+       m.id_sensor, s.txt_unit
+FROM tbl_measure m
+JOIN tbl_sensor s ON m.id_sensor=s.id_sensor
+WHERE m.rl_measurement <> 0 AND m.dt_measure >= %s AND m.dt_measure < %s
+GROUP BY m.id_sensor, s.txt_unit
+HAVING COUNT(*) > 3
+ORDER BY COUNT(*) DESC, total DESC"""
+
+
+def month_start(dt):
+    """First moment of month containing dt"""
+    return datetime.datetime(dt.year, dt.month, 1)
+
+
+def next_month(dt):
+    """First moment of month after dt's month"""
+    return datetime.datetime(dt.year + dt.month // 12, dt.month % 12 + 1, 1)
+
+
+def lst_months(dt_from, dt_to):
+    """Start of each month from dt_from's month to dt_to's month inclusive"""
+    lst_month = []
+    month = month_start(dt_from)
+    while month <= dt_to:
+        lst_month.append(month)
+        month = next_month(month)
+    return lst_month
+
+
+def partition_name(month, table=TABLE):
+    return f"{table}_y{month.year:04d}m{month.month:02d}"
+
+
+def create_partitioned_table(conn, table=TABLE, drop=False, brin_pages_per_range=BRIN_PAGES_PER_RANGE):
+    """Create table partitioned by month of dt_measure with unique index and BRIN index on dt_measure"""
+    with conn.cursor() as cur:
+        if drop:
+            cur.execute(sql.SQL("DROP TABLE IF EXISTS {table}").format(table=sql.Identifier(table)))
+        cur.execute(sql.SQL(SQL_CREATE).format(table=sql.Identifier(table)))
+        cur.execute(sql.SQL(SQL_UNIQUE).format(index=sql.Identifier(f"idx_{table}_time_sensor"),
+                                               table=sql.Identifier(table)))
+        cur.execute(sql.SQL(SQL_BRIN).format(index=sql.Identifier(f"idx_{table}_brin"), table=sql.Identifier(table),
+                                             pages=sql.Literal(int(brin_pages_per_range))))
+    conn.commit()
+
+
+def set_partitions(conn, table=TABLE):
+    """Names of existing partitions of table"""
+    with conn.cursor() as cur:
+        return {row[0] for row in cur.execute(SQL_PARTITIONS, (table,))}
+
+
+def ensure_partitions(conn, dt_from, dt_to, table=TABLE, set_existing=None):
+    """Create monthly partitions covering dt_from to dt_to which don't exist yet. Returns names of partitions created
+
+    :param set_existing: names of partitions known to exist, updated with those created. None to ask the database
+    """
+    if set_existing is None:
+        set_existing = set_partitions(conn, table)
+    lst_created = []
+    with conn.cursor() as cur:
+        for month in lst_months(dt_from, dt_to):
+            name = partition_name(month, table)
+            if name in set_existing:
+                continue
+            cur.execute(sql.SQL(SQL_PARTITION).format(partition=sql.Identifier(name), table=sql.Identifier(table),
+                                                      dt_from=sql.Literal(month), dt_to=sql.Literal(next_month(month))))
+            set_existing.add(name)
+            lst_created.append(name)
+    conn.commit()
+    if lst_created:
+        logger.info(f"ensure_partitions: created {lst_created}")
+    return lst_created
+
+
+def load(conn, rows, backend='psycopg_copy_binary', batch_rows=bulk_load.BATCH_ROWS):
+    """bulk_load rows of (dt_measure, id_sensor, rl_measurement) into tbl_measure, creating partitions first"""
+    set_existing = set_partitions(conn)
+    num = 0
+    for batch in bulk_load.iter_batches(rows, batch_rows):
+        lst_dt = [row[0] for row in batch]
+        ensure_partitions(conn, min(lst_dt), max(lst_dt), set_existing=set_existing)
+        num += bulk_load.bulk_load(conn, batch, backend, batch_rows)
+    return num
+
+
+def drop_partitions_before(conn, dt_before, table=TABLE):
+    """Drop partitions for months entirely before dt_before. Returns names of partitions dropped"""
+    lst_dropped = []
+    with conn.cursor() as cur:
+        for name in sorted(set_partitions(conn, table)):
+            match = RE_PARTITION.search(name)
+            if match and next_month(datetime.datetime(int(match[1]), int(match[2]), 1)) <= dt_before:
+                cur.execute(sql.SQL("DROP TABLE {partition}").format(partition=sql.Identifier(name)))
+                lst_dropped.append(name)
+    conn.commit()
+    return lst_dropped
+
+
+def fetch_aggregate(conn, dt_from, dt_to):
+    """meetup204 aggregate of measurements from dt_from up to but not including dt_to, as list of dict"""
+    with conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
+        return cur.execute(SQL_AGGREGATE, (dt_from, dt_to)).fetchall()
+
+
+def explain(conn, query=SQL_AGGREGATE, params=None):
+    """Lines of EXPLAIN for query. Only partitions which haven't been pruned appear as scans"""
+    # Client side binding so the planner sees the dates and prunes partitions when planning
+    with psycopg.ClientCursor(conn) as cur:
+        return [row[0] for row in cur.execute(sql.SQL("EXPLAIN ") + sql.SQL(query), params)]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    db_config = bulk_load.read_db_config()
+    with psycopg.connect(**db_config) as pg_conn:
+        bulk_load.create_tables(pg_conn, 'postgresql')
+        create_partitioned_table(pg_conn, drop=True)
+        print(f"loaded {load(pg_conn, bulk_load.synthetic_rows(1_000_000))} rows")
+        print(sorted(set_partitions(pg_conn)))
+        dt_query = datetime.datetime(2024, 1, 8)
+        for line in explain(pg_conn, params=(dt_query, dt_query + datetime.timedelta(days=1))):
+            print(line)
+        print(fetch_aggregate(pg_conn, dt_query, dt_query + datetime.timedelta(days=1))[:5])